@@ -0,0 +1,74 @@
+import asyncio, hmac, json, os
+from dotenv import load_dotenv
+
+load_dotenv()
+os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+import tornado.web
+from tornado.iostream import StreamClosedError
+from src.modules.engine import AnswerRequest, answer_events
+from src.modules.events import event_dict
+from src.modules.metrics import prometheus_text
+from src.modules.tools.langfuse import create_trace
+from src.modules.resources import warm_up, llm_client
+from src.modules.tools.vectorstore import qdrant_client, qdrant_client_memory, sparse_embedding_model
+
+API_TOKEN = os.environ.get("WIZ_API_TOKEN")
+
+class AuthenticatedHandler(tornado.web.RequestHandler):
+    # Answers spend the server's LLM and Tavily keys, so a configured token is
+    # required as a bearer token.
+    def prepare(self):
+        if API_TOKEN and not hmac.compare_digest(self.request.headers.get("Authorization", "").encode(), f"Bearer {API_TOKEN}".encode()):
+            raise tornado.web.HTTPError(401)
+
+class AnswerHandler(AuthenticatedHandler):
+    async def post(self):
+        try:
+            request = AnswerRequest.from_dict(json.loads(self.request.body))
+        except (ValueError, TypeError, AttributeError) as e:
+            raise tornado.web.HTTPError(400, reason=str(e).splitlines()[0])
+        request.trace = create_trace(request.query, "AI Search API")
+
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+        self.set_header("X-Accel-Buffering", "no")
+        events = answer_events(request)
+        try:
+            async for event in events:
+                self.write(f"event: {event.type}\ndata: {json.dumps(event_dict(event), default=str)}\n\n")
+                await self.flush()
+        except StreamClosedError:
+            pass
+        finally:
+            await events.aclose()
+
+class HealthHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write({"status": "ok"})
+
+class MetricsHandler(AuthenticatedHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(prometheus_text())
+
+def make_app():
+    return tornado.web.Application([
+        (r"/v1/answer", AnswerHandler),
+        (r"/health", HealthHandler),
+        (r"/metrics", MetricsHandler),
+    ])
+
+async def main():
+    if os.environ.get("WIZ_WARM_UP", "").lower() in ("1", "true"):
+        warm_up(llm_client, qdrant_client, qdrant_client_memory, sparse_embedding_model)
+    host = os.environ.get("WIZ_API_HOST", "127.0.0.1")
+    port = int(os.environ.get("WIZ_API_PORT", 8000))
+    if host not in ("127.0.0.1", "localhost", "::1") and not API_TOKEN:
+        print("Warning: the API is reachable from the network without WIZ_API_TOKEN")
+    make_app().listen(port, address=host)
+    print(f"Wiz API listening on {host}:{port}")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,18 +1,22 @@
-import asyncio, json, os
+import asyncio, os
 import streamlit as st
 from dotenv import load_dotenv
 from src.components.sidebar import side_info
-from src.modules.model import llm_stream
-from src.components.chat import display_chat_messages, feedback, document, followup_questions, example_questions, add_image, display_image
-from src.utils import initialise_session_state, clear_chat_history, abort_chat
-from src.modules.chain import generate_answer_prompt, generate_summary_prompt
-from src.modules.tools.langfuse import start_trace, end_trace
+from src.components.chat import display_chat_messages, feedback, document, followup_questions, example_questions, add_image, display_image, session_request, stream_answer, check_temporary_knowledge
+from src.utils import initialise_session_state, clear_chat_history
+from src.modules.tools.langfuse import start_trace
+from src.modules.resources import warm_up, llm_client
+from src.modules.tools.vectorstore import qdrant_client, qdrant_client_memory, sparse_embedding_model
 
 load_dotenv()
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+if os.environ.get("WIZ_WARM_UP", "").lower() in ("1", "true"):
+    warm_up(llm_client, qdrant_client, qdrant_client_memory, sparse_embedding_model)
+
 @st.fragment
 async def main():
+    check_temporary_knowledge()
     side_info()
     
     if len(st.session_state.messages) == 1:
@@ -28,31 +32,8 @@ async def main():
             
     st.session_state.search_results = None
     if st.session_state.messages[-1]["role"] != "assistant":
-        query = st.session_state.messages[-1]["content"]
-        start_trace(query)
-
-        try:
-            if "summary" in st.session_state.messages[-1] and st.session_state.messages[-1]["summary"]:
-                prompt = await generate_summary_prompt()
-                followup_query_asyncio = None
-            else:
-                prompt, followup_query_asyncio = await generate_answer_prompt()
-        except Exception as e:
-            end_trace(str(e), "ERROR")
-            abort_chat(f"An error occurred: {e}")
-
-        if followup_query_asyncio:
-            followup_query = await followup_query_asyncio
-            if followup_query:
-                followup_query = "[" + followup_query.split("[")[1].split("]")[0] + "]"
-                try:
-                    st.session_state.followup_query = json.loads(followup_query)
-                except json.JSONDecodeError:
-                    st.session_state.followup_query = []
-
-        with st.chat_message("assistant", avatar="✨"):
-            st.write_stream(llm_stream(prompt, "Final Answer"))
-        end_trace(st.session_state.messages[-1]["content"])
+        start_trace(st.session_state.messages[-1]["content"])
+        await stream_answer(session_request())
 
     if len(st.session_state.messages) > 1:
         col1, col2 = st.columns([1, 4])
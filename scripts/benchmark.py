@@ -0,0 +1,291 @@
+import argparse, asyncio, hashlib, json, math, os, resource, sys, time
+from types import SimpleNamespace
+
+# Usage: python -m scripts.benchmark --concurrency 8 --llm-latency 0.3 --token-rate 60
+# Replays queries through the answer, summary and ingestion pipelines against local
+# stand-ins (fake litellm, fake Tavily, in-memory Qdrant, fake BM25) so it needs no
+# network or API keys. Compare runs with --json/--baseline to catch regressions.
+
+QUERIES_PATH = "scripts/intent_eval.jsonl"
+WORDS = "retrieval vector search answer model query document context latency index token stream".split()
+
+def fake_vector(text, size):
+    digest = hashlib.sha256(text.encode()).digest()
+    vector = [digest[i % len(digest)] / 255 - 0.5 for i in range(size)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+class FakeLiteLLM:
+    # Stands in for the litellm module: fixed latency per call, answers streamed at a
+    # fixed token rate, and canned replies for each generation name in the pipeline.
+    def __init__(self, latency, token_rate, answer_tokens, embed_latency, dimensions, intent):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.answer_tokens = answer_tokens
+        self.embed_latency = embed_latency
+        self.dimensions = dimensions
+        self.intent = intent
+
+    def reply(self, name, prompt):
+        query = f"benchmark query {hashlib.md5(str(prompt).encode()).hexdigest()[:6]}"
+        if name == "Query Understanding":
+            return json.dumps({"standalone_query": query, "intent": self.intent, "search_query": query})
+        if name == "Intent":
+            return self.intent
+        if name == "Follow-up Query":
+            return json.dumps([f"{query} follow-up {i}" for i in range(3)])
+        if name in ("Standalone Query", "Query Formatting"):
+            return query
+        return " ".join(WORDS[i % len(WORDS)] for i in range(self.answer_tokens))
+
+    async def acompletion(self, model, messages, metadata=None, stream=False, **kwargs):
+        await asyncio.sleep(self.latency)
+        content = self.reply((metadata or {}).get("generation_name"), messages)
+        if stream:
+            return self.stream(content)
+        return {"choices": [{"message": {"content": content}}]}
+
+    async def stream(self, content):
+        for word in content.split(" "):
+            await asyncio.sleep(1 / self.token_rate)
+            yield {"choices": [{"delta": {"content": word + " "}}]}
+
+    def embedding(self, model, input, **kwargs):
+        time.sleep(self.embed_latency)
+        return SimpleNamespace(data=[{"index": i, "embedding": fake_vector(text, self.dimensions)} for i, text in enumerate(input)])
+
+    def token_counter(self, model=None, text=""):
+        return len(text) // 4
+
+class FakeSparse:
+    def __init__(self, indices, values):
+        import numpy as np
+        self.indices = np.array(indices)
+        self.values = np.array(values, dtype=float)
+
+class FakeBM25:
+    def encode(self, text):
+        counts = {}
+        for word in text.lower().split():
+            index = int(hashlib.md5(word.encode()).hexdigest()[:6], 16)
+            counts[index] = counts.get(index, 0) + 1.0
+        return FakeSparse(list(counts), list(counts.values()))
+
+    def embed(self, texts, batch_size=None):
+        return [self.encode(text) for text in texts]
+
+    def query_embed(self, query):
+        return [self.encode(query)]
+
+class FakeTavily:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def search(self, query, search_depth="advanced", include_images=True, max_results=4):
+        time.sleep(self.latency)
+        return {
+            "results": [{"url": f"https://example.com/{i}", "title": f"Result {i}", "content": f"{query} " + " ".join(WORDS) * 4} for i in range(max_results)],
+            "images": [],
+        }
+
+def install_fakes(args):
+    from src.modules import resources
+    from src.modules.cache import DiskCache
+    from src.modules.tools import vectorstore, search
+    from src.modules import chain
+
+    fakes = {
+        resources.llm_client: FakeLiteLLM(args.llm_latency, args.token_rate, args.answer_tokens, args.embed_latency, vectorstore.DIMENSIONS, args.intent),
+        vectorstore.sparse_embedding_model: FakeBM25(),
+        vectorstore.query_embedding_disk_cache: DiskCache(":memory:"),
+        chain.summary_cache: DiskCache(":memory:"),
+        search.tavily_clients: {"benchmark": FakeTavily(args.search_latency)},
+    }
+    for getter, instance in fakes.items():
+        resources.instances[getter.resource_name] = instance
+    os.environ.pop("TAVILY_API_KEY", None)
+
+def load_queries(path, limit):
+    queries = []
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                row = json.loads(line)
+                queries.append(row.get("query") or row.get("title") or row.get("body"))
+    return [query for query in queries if query][:limit]
+
+def make_documents(count):
+    from langchain_core.documents import Document
+    return [
+        Document(page_content=f"Section {i}. " + " ".join(WORDS[(i + j) % len(WORDS)] for j in range(120)), metadata={"file": f"doc-{i // 20}.md"})
+        for i in range(count)
+    ]
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+async def run_concurrently(items, concurrency, func):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def timed(item):
+        async with semaphore:
+            start = time.perf_counter()
+            await func(item)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[timed(item) for item in items])
+    return latencies, time.perf_counter() - start
+
+async def benchmark(args):
+    from src.modules.engine import AnswerRequest, Run, answer_events
+    from src.modules.chain import generate_answer_prompt, generate_summary_prompt, forget_summaries
+    from src.modules.model import model_list
+    from src.modules.tools.vectorstore import create_collection_and_insert, qdrant_client_memory
+    from src.modules.tools.temporary import temporary_collections
+
+    queries = load_queries(args.queries, args.limit) * args.repeat
+    model_name = args.model or model_list()[0]
+    stages, throughput = {}, {}
+
+    def request(query, collection_names=(), summary=False):
+        messages = [{"role": "assistant", "content": "Hi."}, {"role": "user", "content": query}]
+        return AnswerRequest(
+            messages=messages, model_name=model_name, collection_names=list(collection_names), knowledge_in_memory=True,
+            summary=summary, query_understanding_mode=args.mode, tavily_api_key="benchmark",
+        )
+
+    ingest, collection_names, ingested = [], [], 0
+    for i in range(max(1, args.ingest_runs)):
+        collection_name = f"benchmark-{i}"
+        if qdrant_client_memory().collection_exists(collection_name):
+            qdrant_client_memory().delete_collection(collection_name)
+        start = time.perf_counter()
+        stats = await asyncio.to_thread(create_collection_and_insert, collection_name, make_documents(args.documents), True)
+        ingest.append(time.perf_counter() - start)
+        ingested += stats["added"]
+        temporary_collections().register(collection_name, "benchmark")
+        collection_names.append(collection_name)
+    stages["ingest"] = ingest
+    # Deduplicated chunks are skipped, so throughput counts only what was embedded.
+    throughput["ingest"] = ingested / sum(ingest)
+
+    async def answer_prompt(req):
+        prompt, followup = await generate_answer_prompt(Run(req))
+        if followup:
+            followup.cancel()
+
+    stages["answer_prompt_web"], wall = await run_concurrently([request(q) for q in queries], args.concurrency, answer_prompt)
+    throughput["answer_prompt_web"] = len(queries) / wall
+    stages["answer_prompt_document"], wall = await run_concurrently([request(q, ["benchmark-0"]) for q in queries], args.concurrency, answer_prompt)
+    throughput["answer_prompt_document"] = len(queries) / wall
+    if len(collection_names) > 1:
+        stages["answer_prompt_federated"], wall = await run_concurrently([request(q, collection_names) for q in queries], args.concurrency, answer_prompt)
+        throughput["answer_prompt_federated"] = len(queries) / wall
+
+    async def summary_prompt(req):
+        for collection_name in req.collection_names:
+            forget_summaries(collection_name)
+        await generate_summary_prompt(Run(req))
+
+    summaries = [request("Summarise the document.", ["benchmark-0"], summary=True) for _ in range(args.summary_runs)]
+    stages["summary_prompt"], wall = await run_concurrently(summaries, 1, summary_prompt)
+    throughput["summary_prompt"] = len(summaries) / wall
+
+    ttft = []
+
+    async def answer(req):
+        start, first_token = time.perf_counter(), None
+        events = answer_events(req)
+        try:
+            async for event in events:
+                if event.type == "token" and first_token is None:
+                    first_token = time.perf_counter()
+                    ttft.append(first_token - start)
+                elif event.type == "error":
+                    raise RuntimeError(event.message)
+        finally:
+            await events.aclose()
+
+    stages["answer_end_to_end"], wall = await run_concurrently([request(q) for q in queries], args.concurrency, answer)
+    stages["answer_ttft"] = ttft
+    throughput["answer_end_to_end"] = len(queries) / wall
+    return stages, throughput
+
+def report(stages, throughput, args):
+    results = {
+        "concurrency": args.concurrency,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "stages": {
+            name: {
+                "count": len(values),
+                "p50": round(percentile(values, 50), 4),
+                "p95": round(percentile(values, 95), 4),
+                "throughput": round(throughput[name], 2) if name in throughput else None,
+            }
+            for name, values in stages.items() if values
+        },
+    }
+    unit = {"ingest": "chunks/s"}
+    print(f"{'stage':<26} {'n':>4} {'p50 (s)':>9} {'p95 (s)':>9} {'throughput':>16}")
+    for name, stats in results["stages"].items():
+        rate = f"{stats['throughput']} {unit.get(name, 'req/s')}" if stats["throughput"] is not None else ""
+        print(f"{name:<26} {stats['count']:>4} {stats['p50']:>9.3f} {stats['p95']:>9.3f} {rate:>16}")
+    print(f"\nconcurrency {args.concurrency}, peak RSS {results['peak_rss_mb']} MB")
+    return results
+
+def regressions(results, baseline, tolerance):
+    failed = []
+    for name, stats in results["stages"].items():
+        before = baseline["stages"].get(name)
+        if before and stats["p95"] > before["p95"] * (1 + tolerance):
+            failed.append(f"{name}: p95 {stats['p95']:.3f}s vs {before['p95']:.3f}s")
+    if results["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+        failed.append(f"peak RSS: {results['peak_rss_mb']} MB vs {baseline['peak_rss_mb']} MB")
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the WizSearch pipelines.")
+    parser.add_argument("--queries", default=QUERIES_PATH, help="JSONL file with a query (or title) per line")
+    parser.add_argument("--limit", type=int, default=25, help="Maximum number of queries to replay")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the query set this many times")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--model", default=None, help="Model name from config.yaml (defaults to the first)")
+    parser.add_argument("--mode", choices=["sequential", "combined"], default="sequential", help="Query understanding mode")
+    parser.add_argument("--intent", default="search", help="Intent returned by the fake model")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds before each fake completion responds")
+    parser.add_argument("--token-rate", type=float, default=80, help="Fake streaming rate in tokens per second")
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Seconds per fake embedding call")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="Seconds per fake Tavily search")
+    parser.add_argument("--documents", type=int, default=500, help="Chunks per ingestion run")
+    parser.add_argument("--ingest-runs", type=int, default=3)
+    parser.add_argument("--summary-runs", type=int, default=3)
+    parser.add_argument("--json", default=None, help="Write the results to this file")
+    parser.add_argument("--baseline", default=None, help="Fail if p95 or peak RSS regress against this results file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression against the baseline")
+    args = parser.parse_args()
+
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    install_fakes(args)
+    stages, throughput = asyncio.run(benchmark(args))
+    results = report(stages, throughput, args)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            failed = regressions(results, json.load(file), args.tolerance)
+        for line in failed:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import argparse, time
+from collections import Counter
+from src.modules.intent_router import IntentRouter, load_labelled_queries
+
+# Usage: python -m scripts.evaluate_intent scripts/intent_eval.jsonl --threshold 0.8
+# Each line of the file is a JSON object with "query" and "intent" keys.
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline accuracy of the local intent router.")
+    parser.add_argument("path", help="JSONL file with labelled queries")
+    parser.add_argument("--threshold", type=float, default=None)
+    parser.add_argument("--margin", type=float, default=None)
+    parser.add_argument("--examples", default=None, help="Extra labelled exemplars for the router")
+    args = parser.parse_args()
+
+    router = IntentRouter(examples_path=args.examples)
+    if args.threshold is not None:
+        router.threshold = args.threshold
+    if args.margin is not None:
+        router.margin = args.margin
+
+    rows = load_labelled_queries(args.path)
+    routed, correct, latencies = 0, 0, []
+    confusion = Counter()
+    for query, expected in rows:
+        start = time.perf_counter()
+        intent, _ = router.route(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        confusion[(expected, intent or "llm_fallback")] += 1
+        if intent:
+            routed += 1
+            correct += intent == expected
+
+    latencies.sort()
+    print(f"Queries: {len(rows)}")
+    print(f"Routed locally: {routed} ({routed / max(len(rows), 1):.1%})")
+    print(f"Accuracy on routed: {correct / max(routed, 1):.1%}")
+    print(f"Latency p50: {latencies[len(latencies) // 2]:.1f} ms, p95: {latencies[int(len(latencies) * 0.95)]:.1f} ms")
+    print("Expected -> routed:")
+    for (expected, intent), count in sorted(confusion.items()):
+        print(f"  {expected:>16} -> {intent:<16} {count}")
+
+if __name__ == "__main__":
+    main()
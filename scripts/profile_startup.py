@@ -0,0 +1,52 @@
+import argparse, re, subprocess, sys, time
+
+# Usage: python -m scripts.profile_startup [--warm-up]
+# Reports the cumulative import time of each top-level module in a fresh interpreter,
+# then (optionally) how long every shared resource takes to initialise.
+
+MODULES = [
+    "src.modules.resources",
+    "src.modules.cache",
+    "src.modules.model",
+    "src.modules.prompt",
+    "src.modules.tools.vectorstore",
+    "src.modules.tools.search",
+    "src.modules.chain",
+    "app",
+]
+
+def import_time(module):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        return None, wall, result.stderr.strip().splitlines()[-1]
+    cumulative = 0
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+        if match and match.group(3) == module:
+            cumulative = int(match.group(1))
+    return cumulative / 1e6, wall, None
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start profile of WizSearch modules.")
+    parser.add_argument("--warm-up", action="store_true", help="Also initialise every shared resource")
+    args = parser.parse_args()
+
+    print(f"{'module':<32} {'import (s)':>10} {'process (s)':>12}")
+    for module in MODULES:
+        seconds, wall, error = import_time(module)
+        if error:
+            print(f"{module:<32} {'failed':>10} {wall:>12.2f}  {error}")
+        else:
+            print(f"{module:<32} {seconds:>10.2f} {wall:>12.2f}")
+
+    if args.warm_up:
+        import app
+        from src.modules.resources import warm_up
+        print(f"\n{'resource':<56} {'init (s)':>8}")
+        for name, seconds in sorted(warm_up().items(), key=lambda item: item[1], reverse=True):
+            print(f"{name:<56} {seconds:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import argparse, math, time
+import numpy as np
+from qdrant_client import models
+from src.modules.tools.vectorstore import qdrant_client
+from src.modules.tools.storage import PROFILES, dense_vector_params, quantization_kind, search_params
+
+# Usage: python -m scripts.storage_profile my-knowledge --sample 5000 --queries 200 --k 10
+# Copies a sample of a collection's dense vectors into one scratch collection per storage
+# profile and reports estimated vector memory, recall@k against exact full-precision
+# search, and query latency. Needs a Qdrant server (QDRANT_URL); local mode ignores
+# quantization and HNSW settings.
+
+def sample_vectors(client, collection_name, count):
+    vectors, offset = [], None
+    while len(vectors) < count:
+        records, offset = client.scroll(
+            collection_name=collection_name,
+            limit=min(256, count - len(vectors)),
+            offset=offset,
+            with_payload=False,
+            with_vectors=["text-dense"],
+        )
+        vectors.extend(record.vector["text-dense"] for record in records)
+        if offset is None:
+            break
+    return np.array(vectors, dtype=np.float32)
+
+def exact_neighbours(points, queries, k):
+    points = points / np.linalg.norm(points, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = queries @ points.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+def estimate_memory(profile, count, dimensions):
+    # Rough sizes of what Qdrant keeps per vector: originals (float32), the quantized
+    # copy and the HNSW graph (about 2 * m links of 4 bytes on the base layer).
+    size = min(profile.get("dimensions") or dimensions, dimensions)
+    parts = [("original", count * size * 4, not profile.get("on_disk"))]
+    if profile.get("quantization") == "scalar":
+        parts.append(("quantized", count * size, profile.get("always_ram", True)))
+    elif profile.get("quantization") == "binary":
+        parts.append(("quantized", count * math.ceil(size / 8), profile.get("always_ram", True)))
+    parts.append(("hnsw", count * profile.get("hnsw_m", 16) * 2 * 4, not profile.get("hnsw_on_disk")))
+    ram = sum(nbytes for _, nbytes, in_ram in parts if in_ram)
+    disk = sum(nbytes for _, nbytes, in_ram in parts if not in_ram)
+    return ram / 2**20, disk / 2**20
+
+def wait_for_index(client, collection_name, timeout=600):
+    deadline = time.time() + timeout
+    while client.get_collection(collection_name).status != models.CollectionStatus.GREEN:
+        if time.time() > deadline:
+            raise TimeoutError(f"{collection_name} is still indexing")
+        time.sleep(0.5)
+
+def measure(client, collection_name, profile, points, queries, truth, k):
+    vector_params = dense_vector_params(profile, points.shape[1])
+    client.create_collection(
+        collection_name,
+        vectors_config={"text-dense": vector_params},
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=1),
+    )
+    size = vector_params.size
+    for start in range(0, len(points), 256):
+        client.upsert(
+            collection_name=collection_name,
+            points=[
+                models.PointStruct(id=start + i, vector={"text-dense": vector[:size].tolist()})
+                for i, vector in enumerate(points[start:start + 256])
+            ],
+        )
+    wait_for_index(client, collection_name)
+
+    params = search_params(quantization_kind(vector_params))
+    hits, latencies = 0, []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        result = client.query_points(collection_name, query=query[:size].tolist(), using="text-dense", limit=k, search_params=params)
+        latencies.append(time.perf_counter() - start)
+        hits += len({point.id for point in result.points} & expected)
+    latencies.sort()
+    return hits / (k * len(queries)), latencies[len(latencies) // 2], latencies[max(0, math.ceil(0.95 * len(latencies)) - 1)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory and recall@k of each storage profile on a sample collection.")
+    parser.add_argument("collection", help="Existing knowledge collection to sample")
+    parser.add_argument("--profiles", nargs="*", default=None, help="Profiles from config.yaml (default: all)")
+    parser.add_argument("--sample", type=int, default=5000, help="Vectors copied into each scratch collection")
+    parser.add_argument("--queries", type=int, default=200, help="Held-out vectors used as queries")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch collections")
+    args = parser.parse_args()
+
+    client = qdrant_client()
+    vectors = sample_vectors(client, args.collection, args.sample + args.queries)
+    if len(vectors) <= args.queries:
+        raise SystemExit(f"{args.collection} has only {len(vectors)} vectors")
+    queries, points = vectors[:args.queries], vectors[args.queries:]
+    truth = exact_neighbours(points, queries, args.k)
+    print(f"{len(points)} vectors of {points.shape[1]} dimensions, {len(queries)} queries, k={args.k}\n")
+
+    print(f"{'profile':<16} {'RAM (MB)':>9} {'disk (MB)':>10} {f'recall@{args.k}':>10} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+    for name in args.profiles or list(PROFILES):
+        profile = PROFILES[name]
+        scratch = f"{args.collection}-profile-{name}"
+        if client.collection_exists(scratch):
+            client.delete_collection(scratch)
+        try:
+            recall, p50, p95 = measure(client, scratch, profile, points, queries, truth, args.k)
+        finally:
+            if not args.keep and client.collection_exists(scratch):
+                client.delete_collection(scratch)
+        ram, disk = estimate_memory(profile, len(points), points.shape[1])
+        print(f"{name:<16} {ram:>9.1f} {disk:>10.1f} {recall:>10.3f} {p50 * 1000:>9.1f} {p95 * 1000:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,17 @@
 import streamlit as st
 import base64, secrets
 from pathlib import Path
-from markitdown import MarkItDown
-from langchain_text_splitters import RecursiveCharacterTextSplitter, MarkdownHeaderTextSplitter
 from streamlit_feedback import streamlit_feedback
-from src.modules.tools.vectorstore import create_collection_and_insert, all_collections
-from src.modules.tools.search import jina_reader
-from src.utils import clear_chat_history
+from src.modules.tools.vectorstore import create_collection_and_insert, all_collections, CONVERT_WORKERS
+from src.modules.tools.converter import convert_documents, text_splitter
+from src.modules.tools.storage import profile_names, DEFAULT_PROFILE
+from src.modules.tools.answer_cache import invalidate_collection
+from src.modules.tools.temporary import temporary_collections
+from src.modules.tools.crawler import website_documents, MAX_DEPTH, MAX_PAGES
+from src.utils import clear_chat_history, abort_chat, session_id
 from src.modules.model import is_vision_model
+from src.modules.engine import AnswerRequest, answer_events
+from src.modules.chain import QUERY_UNDERSTANDING_MODE
 
 def display_chat_messages(messages):
     icons = {"assistant": "✨", "user": "👤"}
@@ -15,6 +19,67 @@ def display_chat_messages(messages):
         with st.chat_message(message["role"], avatar=icons[message["role"]]):
             st.markdown(message["content"])
 
+def session_request():
+    last_message = st.session_state.messages[-1]
+    return AnswerRequest(
+        messages=st.session_state.messages,
+        model_name=st.session_state.model_name,
+        temperature=st.session_state.temperature,
+        max_tokens=st.session_state.max_tokens,
+        top_k=st.session_state.top_k,
+        image_search=st.session_state.image_search,
+        image_data=st.session_state.image_data,
+        collection_names=st.session_state.collection_names if st.session_state.vectorstore else [],
+        knowledge_in_memory=st.session_state.knowledge_in_memory,
+        summary=bool(last_message.get("summary")),
+        query_understanding_mode=st.session_state.get("query_understanding_mode", QUERY_UNDERSTANDING_MODE),
+        tavily_api_key=st.session_state.get("tavily_api_key"),
+        history_summary=st.session_state.history_summary,
+        trace=st.session_state.trace,
+    )
+
+async def stream_answer(request):
+    if request.summary:
+        st.toast("Process may take a while, please wait...", icon="⏳")
+        status = st.status("📝 Reading through the document...", expanded=False)
+    else:
+        status = st.status("🚀 AI at work...", expanded=True)
+    placeholder, parts = None, []
+    events = answer_events(request)
+    try:
+        async for event in events:
+            if event.type == "progress":
+                status.write(event.message)
+            elif event.type == "search_results":
+                st.session_state.search_results = event.results
+                with status:
+                    display_search_result(event.results)
+            elif event.type in ("token", "answer") and placeholder is None:
+                status.update(label="Task completed!", state="complete", expanded=False)
+                placeholder = st.chat_message("assistant", avatar="✨").empty()
+            if event.type == "token":
+                parts.append(event.text)
+                placeholder.markdown("".join(parts) + "▌")
+            elif event.type == "answer":
+                placeholder.markdown(event.answer)
+                st.session_state.messages.append({"role": "assistant", "content": event.answer})
+                st.session_state.stream_metrics = event.metrics
+            elif event.type == "followup":
+                st.session_state.followup_query = event.questions
+            elif event.type == "done":
+                st.session_state.history_summary = event.history_summary
+            elif event.type == "error":
+                status.update(state="error", expanded=False)
+                if event.code == "missing_api_key":
+                    st.warning(event.message, icon="⚠️")
+                    st.stop()
+                if event.code == "collection_expired":
+                    st.session_state.vectorstore = False
+                    st.session_state.collection_names = []
+                abort_chat(event.message)
+    finally:
+        await events.aclose()
+
 def display_search_result(search_results):
     if st.session_state.vectorstore:
         with st.expander("Document Result", expanded=False):
@@ -72,26 +137,48 @@ def example_questions():
         st.rerun()
 
 
+def ingest_progress():
+    progress = st.progress(0.0, text="Please wait, ingesting documents ⌛...")
+    def on_progress(done, total):
+        progress.progress(done / total, text=f"Ingested {done}/{total} chunks ⌛...")
+    return on_progress
+
+def ingest(collection_name, documents, profile=None):
+    stats = create_collection_and_insert(collection_name, documents, st.session_state.knowledge_in_memory, ingest_progress(), profile)
+    if stats["added"] or stats["deleted"]:
+        invalidate_collection(collection_name)
+    if st.session_state.knowledge_in_memory:
+        temporary_collections().register(collection_name, session_id())
+    st.toast(f"{stats['added']} chunks added, {stats['skipped']} unchanged, {stats['deleted']} removed", icon="📚")
+    return stats
+
+
 @st.dialog("📚 Add Knowledge")
 def add_knowledge():
     temp_storage = st.toggle("Temporary Storage", value=st.session_state.knowledge_in_memory)
 
+    profile = None
     if temp_storage:
         new_collection = secrets.token_hex(16)
         st.session_state.knowledge_in_memory = True
     else:
         st.session_state.knowledge_in_memory = False
         collections = all_collections()
-        col1, col2 = st.columns(2)
-        collection_name = col1.selectbox("Select a Knowledge", collections, index=None)
-        if collection_name:
-            st.session_state.collection_name = collection_name
-            st.session_state.vectorstore = True
-            st.rerun()
-        new_collection = col2.text_input("Add a new knowledge", placeholder="Enter new knowledge name")
-        if new_collection in collections:
-            st.error("Knowledge already exists. Please choose a different name.")
-            st.stop()
+        if st.toggle("Update an existing knowledge", value=False, disabled=not collections):
+            new_collection = st.selectbox("Knowledge to update", collections, index=None) or ""
+        else:
+            col1, col2 = st.columns([4, 1], vertical_alignment="bottom")
+            collection_names = col1.multiselect("Select Knowledge", collections, placeholder="Search across one or more knowledge")
+            if col2.button("Attach", use_container_width=True, disabled=not collection_names):
+                st.session_state.collection_names = collection_names
+                st.session_state.vectorstore = True
+                st.rerun()
+            new_collection = st.text_input("Add a new knowledge", placeholder="Enter new knowledge name")
+            if new_collection in collections:
+                st.error("Knowledge already exists. Please choose a different name.")
+                st.stop()
+            if len(profile_names()) > 1:
+                profile = st.selectbox("Storage Profile", profile_names(), index=profile_names().index(DEFAULT_PROFILE))
 
     if new_collection.strip() != "":
         tab1, tab2 = st.tabs(["Upload Document", "Add Website"])
@@ -123,48 +210,36 @@ def add_knowledge():
 
                 _, col, _ = st.columns([1, 2, 1])
                 if col.button("Submit", use_container_width=True, type="primary"):
-                    st.session_state.collection_name = new_collection
-                    all_texts = []
-                    all_metadatas = []
-                    
-                    for file_path in file_paths:
-                        md = MarkItDown()
-                        result = md.convert(str(file_path))
-                        all_texts.append(result.text_content)
-                        all_metadatas.append({"file": file_path.name.split('_', 1)[1]})
-
-                    text_splitter = RecursiveCharacterTextSplitter(
+                    st.session_state.collection_names = [new_collection]
+                    splitter = text_splitter(
                         chunk_size=st.session_state.get("chunk_size") or 500,
                         chunk_overlap=st.session_state.get("chunk_overlap") or 80,
-                        separators=["\n\n", "\n", " ", ""],
                     )
 
-                    chunks = text_splitter.create_documents(all_texts, metadatas=all_metadatas)
+                    chunks = convert_documents(file_paths, splitter, CONVERT_WORKERS)
                     _, col, _ = st.columns([1, 4, 1])
                     with col:
-                        with st.spinner("Please wait, ingesting documents ⌛..."):
-                            create_collection_and_insert(st.session_state.collection_name, chunks, st.session_state.knowledge_in_memory)
-                            for file_path in file_paths:
-                                file_path.unlink()
+                        ingest(new_collection, chunks, profile)
+                        for file_path in file_paths:
+                            file_path.unlink()
                     st.session_state.vectorstore = True
                     st.rerun()
         with tab2:
             website_url = st.text_input("Website URL", placeholder="Enter website URL")
+            with st.expander("Crawl Settings", expanded=False):
+                col1, col2 = st.columns(2)
+                depth = col1.slider("Link Depth", min_value=0, max_value=max(MAX_DEPTH, 1), value=0, help="0 reads only this page", disabled=MAX_DEPTH == 0)
+                pages = col2.slider("Max Pages", min_value=1, max_value=max(MAX_PAGES, 2), value=max(MAX_PAGES, 1), disabled=MAX_PAGES <= 1)
             if website_url:
-                markdown_document = jina_reader(website_url)
-                headers_to_split_on = [
-                    ("#", "Header 1"),
-                    ("##", "Header 2"),
-                    ("###", "Header 3"),
-                ]
-                markdown_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
-                md_header_splits = markdown_splitter.split_text(markdown_document)
                 _, col, _ = st.columns([1, 4, 1])
                 with col:
                     if st.button("Submit", use_container_width=True, type="primary"):
-                        st.session_state.collection_name = new_collection
-                        with st.spinner("Please wait, ingesting documents ⌛..."):
-                            create_collection_and_insert(new_collection, md_header_splits, st.session_state.knowledge_in_memory)
+                        try:
+                            ingest(new_collection, website_documents(website_url, depth, pages), profile)
+                        except Exception as e:
+                            st.error(f"Could not read {website_url}: {e}")
+                            st.stop()
+                        st.session_state.collection_names = [new_collection]
                         st.session_state.vectorstore = True
                         st.rerun()
 
@@ -201,13 +276,25 @@ def display_image():
             for i, image in enumerate(st.session_state.image_data):
                 cols[i].image(image, use_container_width=True)
 
+def check_temporary_knowledge():
+    collections = temporary_collections()
+    attached = st.session_state.collection_names if st.session_state.vectorstore else []
+    if st.session_state.knowledge_in_memory and not all(collections.exists(name) for name in attached):
+        st.session_state.vectorstore = False
+        st.session_state.collection_names = []
+        st.toast("Temporary knowledge expired, please add it again.", icon="⌛")
+
 def document():
     if not st.session_state.vectorstore:
         if st.button("📚 Add Knowledge", use_container_width=True):
             add_knowledge()
     else:
-        if st.button(f"🗑️ {st.session_state.collection_name[:16]}...", use_container_width=True):
+        label = ", ".join(st.session_state.collection_names)
+        if st.button(f"🗑️ {label[:16]}...", use_container_width=True, help=label):
+            if st.session_state.knowledge_in_memory:
+                for collection_name in st.session_state.collection_names:
+                    temporary_collections().release(collection_name)
             st.session_state.vectorstore = False
-            st.session_state.collection_name = None
+            st.session_state.collection_names = []
             clear_chat_history()
             st.rerun()
\ No newline at end of file
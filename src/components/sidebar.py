@@ -2,8 +2,11 @@ import json
 import os
 import streamlit as st
 from streamlit_lottie import st_lottie
-from src.modules.tools.vectorstore import all_collections, delete_collection, collection_info
+from src.modules.tools.vectorstore import all_collections, delete_collection, collection_info, query_embedding_cache_stats
 from src.modules.model import model_list
+from src.modules.tools.answer_cache import invalidate_collection
+from src.modules.chain import QUERY_UNDERSTANDING_MODE, forget_summaries
+from src.modules.tools.temporary import temporary_collections
 
 @st.dialog("View knowledge")
 def system_settings():
@@ -14,6 +17,8 @@ def system_settings():
         collection_name = col1.selectbox("Select a document", collections, index=0, label_visibility="collapsed")
         if col2.button("🗑️", use_container_width=True):
             delete_collection(collection_name)
+            invalidate_collection(collection_name)
+            forget_summaries(collection_name)
             st.rerun()
         if collection_name:
             collection = collection_info(collection_name)
@@ -24,6 +29,10 @@ def system_settings():
                 col3.metric(label="Dense Vector Size", value=collection.config.params.vectors['text-dense'].size) 
     else:
         st.warning("No documents found")
+    cache_stats = query_embedding_cache_stats()["memory"]
+    st.caption(f"Query embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} entries")
+    temporary = temporary_collections().report()
+    st.caption(f"Temporary knowledge: {temporary['collections']} collections, {temporary['vector_bytes'] / 2**20:.1f} of {temporary['max_bytes'] / 2**20:.0f} MB vectors")
 
 def side_info():
     with st.sidebar:
@@ -54,6 +63,7 @@ def side_info():
             st.slider("Max tokens", min_value=0, max_value=8000, value=2500, key="max_tokens")
             st.slider("Top search results", min_value=1, max_value=10, value=4, key="top_k")
             st.checkbox("Use image search", key="image_search", value=True)
+            st.radio("Query understanding", ["sequential", "combined"], index=["sequential", "combined"].index(QUERY_UNDERSTANDING_MODE), key="query_understanding_mode", horizontal=True, help="Combined classifies and rewrites the query in a single LLM call.")
 
         if st.button("📚 My knowledge's", use_container_width=True):
             system_settings()
@@ -0,0 +1,126 @@
+import hashlib, json, sqlite3, threading, time
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+
+def make_key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class LRUCache:
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+class DiskCache:
+    def __init__(self, path, ttl=None):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, namespace TEXT)")
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(cache)")]
+        if "namespace" not in columns:
+            self.connection.execute("ALTER TABLE cache ADD COLUMN namespace TEXT")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS cache_namespace ON cache (namespace)")
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            row = self.connection.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and (row[1] is None or row[1] > time.time()):
+                self.hits += 1
+                return json.loads(row[0])
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None, namespace=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, namespace) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, namespace),
+            )
+            self.connection.commit()
+
+    def delete_namespace(self, namespace):
+        with self.lock:
+            self.connection.execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+            self.connection.commit()
+
+    def delete(self, key):
+        with self.lock:
+            self.connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.connection.commit()
+
+    def stats(self):
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
+
+class SingleFlight:
+    # Concurrent calls with the same key share the result of the first one in flight.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Future()
+        if not leader:
+            return call.result()
+        try:
+            result = func(*args, **kwargs)
+            call.set_result(result)
+            return result
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
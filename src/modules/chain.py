@@ -1,92 +1,339 @@
-import asyncio
-import streamlit as st
-from src.modules.model import llm_generate
-from src.components.chat import display_search_result
-from src.modules.tools.vectorstore import search_collection, all_points
-from src.modules.prompt import intent_prompt, search_rag_prompt, standalone_query_prompt
-from src.utils import abort_chat
-from src.modules.tools.search import initialise_tavily
-from src.modules.tools.langfuse import end_trace
+import asyncio, threading
+from typing import Literal, Optional
+from pydantic import BaseModel, ValidationError, field_validator
+from src.modules.model import llm_generate, select_model, CONFIG, LLM_MAX_CONCURRENCY
+from src.modules.cache import DiskCache, make_key
+from src.modules.resources import shared
+from src.modules.tools.vectorstore import search_collections, all_points
+from src.modules.tools.temporary import temporary_collections, register_release_hook
+from src.modules.prompt import intent_prompt, search_rag_prompt, standalone_query_prompt, query_understanding_prompt
+from src.modules.tools.search import tavily_client, tavily_search
 from src.modules.prompt import base_prompt, query_formatting_prompt, generate_prompt, followup_query_prompt, key_points_prompt, summary_prompt
 from src.modules.model import is_vision_model
+from src.modules.tools.answer_cache import lookup_answer, invalidate_collection
+from src.modules.intent_router import route_intent
+from src.modules.history import budgeted_history
+from src.modules.events import SearchResultsEvent
+from src.utils import fetch_images
+from src.modules.metrics import register_collector
 
-async def process_query():
-    query = st.session_state.messages[-1]["content"]
-    if len(st.session_state.messages) > 3:
-        history = st.session_state.messages[:-1]
-        query = await llm_generate(standalone_query_prompt(query, history), "Standalone Query")
-        st.write(f"❓ Standalone query: {query}")
-    st.write("🔄 Processing your query...")
-    intent = await llm_generate(intent_prompt(query), "Intent")
+QUERY_UNDERSTANDING_MODE = CONFIG.get("query_understanding", {}).get("mode", "sequential")
+SPECULATIVE_RETRIEVAL = CONFIG.get("speculative_retrieval", {}).get("enabled", False)
+
+SUMMARY = CONFIG.get("summary", {})
+SUMMARY_REDUCE_CHARS = SUMMARY.get("reduce_chars", 12000)
+
+@shared
+def summary_cache():
+    return DiskCache(SUMMARY.get("cache_path", ".cache/summary.sqlite"))
+
+class PipelineError(Exception):
+    def __init__(self, message, level="ERROR", detail=None, code=None):
+        super().__init__(message)
+        self.message = message
+        self.level = level
+        self.detail = detail
+        self.code = code
+
+speculation_stats = {"started": 0, "used": 0, "wasted": 0}
+speculation_lock = threading.Lock()
+
+def record_speculation(run, outcome):
+    with speculation_lock:
+        speculation_stats[outcome] += 1
+    if run.trace:
+        run.trace.update(metadata={"speculative_retrieval": outcome})
+
+def speculation_metrics():
+    with speculation_lock:
+        stats = dict(speculation_stats)
+    lines = [
+        "# HELP wiz_speculative_retrievals_total Speculative retrievals, by outcome.",
+        "# TYPE wiz_speculative_retrievals_total counter",
+    ]
+    return lines + [f'wiz_speculative_retrievals_total{{outcome="{outcome}"}} {count}' for outcome, count in stats.items()]
+
+register_collector(speculation_metrics)
+
+class QueryUnderstanding(BaseModel):
+    standalone_query: str
+    intent: Literal["search", "generate", "greeting", "query_not_clear", "out_of_scope"]
+    search_query: Optional[str] = None
+
+    @field_validator("intent", mode="before")
+    @classmethod
+    def normalise_intent(cls, value):
+        return str(value).strip().strip("'\"").lower()
+
+def parse_query_understanding(response):
+    start, end = response.find("{"), response.rfind("}")
+    if start == -1 or end < start:
+        return None
+    try:
+        understanding = QueryUnderstanding.model_validate_json(response[start:end + 1])
+    except ValidationError:
+        return None
+    if not understanding.standalone_query.strip():
+        return None
+    if understanding.intent == "search" and not (understanding.search_query or "").strip():
+        understanding.search_query = understanding.standalone_query
+    return understanding
+
+async def understand_query(run):
+    messages = run.request.messages
+    history = messages[:-1] if len(messages) > 3 else None
+    response = await llm_generate(query_understanding_prompt(run.request.query, history), "Query Understanding", run.request, response_format={"type": "json_object"})
+    return parse_query_understanding(response)
+
+async def process_query(run, on_query=None):
+    request, trace = run.request, run.trace
+    combined = request.query_understanding_mode == "combined"
+    if trace:
+        trace.update(metadata={"query_understanding": "combined" if combined else "sequential"})
+    if combined:
+        # No speculation here: the only query available before the single call is the
+        # unresolved message, which rarely matches the search query it produces.
+        run.progress("🔄 Processing your query...")
+        with run.span("query_understanding"):
+            understanding = await understand_query(run)
+        if understanding:
+            if understanding.standalone_query != request.query:
+                run.progress(f"❓ Standalone query: {understanding.standalone_query}")
+            run.progress(f"🔍 Intent validated...")
+            return understanding.standalone_query, understanding.intent, understanding.search_query
+        run.progress("↩️ Falling back to step-by-step query processing...")
+
+    query = request.query
+    if len(request.messages) > 3:
+        history = request.messages[:-1]
+        with run.span("standalone_query"):
+            query = await llm_generate(standalone_query_prompt(query, history), "Standalone Query", request)
+        run.progress(f"❓ Standalone query: {query}")
+    run.progress("🔄 Processing your query...")
+    if on_query:
+        on_query(query)
+    with run.span("intent") as fields:
+        intent = await asyncio.to_thread(route_intent, query)
+        fields["router"] = "local" if intent else "llm"
+        if not intent:
+            intent = await llm_generate(intent_prompt(query), "Intent", request)
+    if trace:
+        trace.update(metadata={"intent_router": fields["router"]})
     intent = intent.strip().lower()
-    st.write(f"🔍 Intent validated...")
-    return query, intent
+    run.progress(f"🔍 Intent validated...")
+    return query, intent, None
+
+def use_collection(request):
+    if not request.knowledge_in_memory:
+        return
+    # touch() runs for every collection so none of them idles out while another is missing.
+    if not all([temporary_collections().touch(name) for name in request.collection_names]):
+        raise PipelineError("The temporary knowledge has expired. Please add it again.", "WARNING", "Temporary collection evicted", code="collection_expired")
+
+async def retrieve(run, query, tavily=None):
+    request = run.request
+    if request.vectorstore:
+        use_collection(request)
+        with run.span("retrieval", source="document", collections=len(request.collection_names)):
+            return await asyncio.to_thread(search_collections, request.collection_names, query, request.top_k, request.knowledge_in_memory)
+    tavily = tavily or tavily_client(run.tavily_api_key())
+    with run.span("retrieval", source="web"):
+        return await asyncio.to_thread(tavily_search, tavily, query, "advanced", request.image_search, request.top_k)
 
-async def search_vectorstore(query):
-    trace = st.session_state.trace
-    st.write("📚 Searching the document...")
+async def search_vectorstore(run, query, retrieval=None, history=None):
+    trace = run.trace
+    run.progress("📚 Searching the document...")
     if trace:
-        retrieval = trace.span(name="Retrieval", metadata={"search": "document"}, input=query)
-    search_results = search_collection(st.session_state.collection_name, query, st.session_state.top_k, st.session_state.knowledge_in_memory)
-    st.session_state.search_results = search_results
+        retrieval_span = trace.span(name="Retrieval", metadata={"search": "document"}, input=query)
+    search_results = await (retrieval or retrieve(run, query))
+    run.search_results = search_results
     if trace:
-        retrieval.end(output=search_results)
+        retrieval_span.end(output=search_results)
     if search_results:
-        return search_rag_prompt(search_results, st.session_state.messages)
+        messages = await history if history else run.request.messages
+        with run.span("prompt_build", source="document"):
+            return search_rag_prompt(search_results, messages)
 
-async def search_tavily(query):
-    tavily = initialise_tavily()
-    trace = st.session_state.trace
-    st.write("🌐 Searching the web...")
+async def search_tavily(run, query, retrieval=None, history=None):
+    tavily = tavily_client(run.tavily_api_key())
+    trace = run.trace
+    run.progress("🌐 Searching the web...")
     if trace:
-        retrieval = trace.span(name="Retrieval", metadata={"search": "tavily"}, input=query)
-    search_results = tavily.search(query, search_depth="advanced", include_images=st.session_state.image_search, max_results=st.session_state.top_k)
-    st.session_state.search_results = search_results
+        retrieval_span = trace.span(name="Retrieval", metadata={"search": "tavily"}, input=query)
+    search_results = await (retrieval or retrieve(run, query, tavily))
+    run.search_results = search_results
     if trace:
-        retrieval.end(output=search_results)                
+        retrieval_span.end(output=search_results)
     if search_results["results"]:
         search_context = [{"url": obj["url"], "content": obj["content"]} for obj in search_results["results"]]
-        image_urls = []
-        if is_vision_model(st.session_state.model_name):
-            image_urls = search_results["images"]
-        return search_rag_prompt(search_context, st.session_state.messages, image_urls)
+        images = []
+        if is_vision_model(run.request.model_name):
+            # Image downloads block on slow hosts, so they run off the event loop.
+            images = await asyncio.to_thread(fetch_images, search_results["images"], 2)
+        messages = await history if history else run.request.messages
+        with run.span("prompt_build", source="web"):
+            return search_rag_prompt(search_context, messages, images)
     else:
-        if trace:
-            end_trace("No search results found", "WARNING")
-        abort_chat("I'm sorry, There was an error in search. Please try again.")
-
-async def generate_answer_prompt():
-    with st.status("🚀 AI at work...", expanded=True) as status:
-        query, intent = await process_query()
-        followup_query_asyncio = asyncio.create_task(llm_generate(followup_query_prompt(st.session_state.messages), "Follow-up Query"))
-                    
-        if len(st.session_state.image_data):
-            prompt = generate_prompt(query, st.session_state.messages, st.session_state.image_data)
-        elif "search" in intent:
-            query = await llm_generate(query_formatting_prompt(query), "Query Formatting")
-            st.write(f"📝 Search query: {query}")
-            if st.session_state.vectorstore:
-                prompt = await search_vectorstore(query)
+        raise PipelineError("I'm sorry, There was an error in search. Please try again.", "WARNING", "No search results found")
+
+def answer_cache_entry(run, query):
+    if run.request.vectorstore:
+        return {"query": query, "kind": "document", "collection_names": run.request.collection_names}
+    return {"query": query, "kind": "web"}
+
+async def lookup_cached_answer(run, query):
+    entry = answer_cache_entry(run, query)
+    cached = await asyncio.to_thread(lookup_answer, **entry)
+    if cached and run.trace:
+        run.trace.update(metadata={"answer_cache": "hit", "cached_query": cached["query"]})
+    return cached
+
+async def generate_answer_prompt(run):
+    request = run.request
+    speculation = {}
+
+    def speculate(query):
+        # Most traffic is "search", so retrieval starts on the standalone query alongside
+        # intent detection and is kept whenever the intent confirms it.
+        if SPECULATIVE_RETRIEVAL and not len(request.image_data):
+            tavily = None if request.vectorstore else tavily_client(run.tavily_api_key())
+            speculation["query"] = query
+            speculation["task"] = asyncio.create_task(retrieve(run, query, tavily))
+            record_speculation(run, "started")
+
+    def discard_speculation():
+        if "task" in speculation:
+            speculation.pop("task").cancel()
+            record_speculation(run, "wasted")
+
+    history = None
+    try:
+        query, intent, search_query = await process_query(run, speculate)
+        followup_query_asyncio = asyncio.create_task(llm_generate(followup_query_prompt(request.messages), "Follow-up Query", request))
+        history = asyncio.create_task(budgeted_history(request.messages, request))
+
+        try:
+            if len(request.image_data):
+                messages = await history
+                with run.span("prompt_build", source="image"):
+                    prompt = generate_prompt(query, messages, request.image_data)
+            elif "search" in intent and (cached := await lookup_cached_answer(run, query)):
+                discard_speculation()
+                run.progress("⚡ Found an answer to a similar question...")
+                run.search_results = cached["search_results"]
+                run.cached_answer = cached["answer"]
+                prompt = None
+            elif "search" in intent:
+                run.answer_cache_entry = answer_cache_entry(run, query)
+                retrieval = speculation.pop("task", None)
+                if retrieval:
+                    record_speculation(run, "used")
+                    query = speculation["query"]
+                elif search_query:
+                    query = search_query
+                else:
+                    with run.span("formatting"):
+                        query = await llm_generate(query_formatting_prompt(query), "Query Formatting", request)
+                run.progress(f"📝 Search query: {query}")
+                if request.vectorstore:
+                    prompt = await search_vectorstore(run, query, retrieval, history)
+                else:
+                    prompt = await search_tavily(run, query, retrieval, history)
+            elif "generate" in intent:
+                run.progress("🔮 Generating response...")
+                messages = await history
+                with run.span("prompt_build", source="generate"):
+                    prompt = generate_prompt(query, messages)
             else:
-                prompt = await search_tavily(query)
-        elif "generate" in intent:
-            st.write("🔮 Generating response...")
-            prompt = generate_prompt(query, st.session_state.messages)
-        else:
-            prompt = base_prompt(intent, query)
-            
-        if st.session_state.search_results:
-            display_search_result(st.session_state.search_results)      
-        status.update(label="Task completed!", state="complete", expanded=False)
+                prompt = base_prompt(intent, query)
+        except BaseException:
+            followup_query_asyncio.cancel()
+            raise
+    finally:
+        discard_speculation()
+        if history:
+            history.cancel()
+
+    if run.search_results:
+        run.emit(SearchResultsEvent(run.search_results))
     return prompt, followup_query_asyncio
 
-async def generate_summary_prompt():
-    with st.status("📝 Reading through the document...", expanded=False) as status:
-        st.toast("Process may take a while, please wait...", icon="⏳")
-        query = st.session_state.messages[-1]["content"]
-        all_texts = all_points(st.session_state.collection_name, st.session_state.knowledge_in_memory)
-        tasks = [llm_generate(key_points_prompt(text), "Key Points") for text in all_texts]
-        key_points = await asyncio.gather(*tasks)
-        status.update(label="Task completed!", state="complete", expanded=False)
-    key_points = "\n".join([f"{point}" for point in key_points])
-    return summary_prompt(query, key_points)
+async def map_key_points(run, collection_name, text):
+    # Key points are cached per collection so deleting it can clear them; without a
+    # collection (merging several) nothing is cached.
+    if collection_name is None:
+        return await llm_generate(key_points_prompt(text), "Key Points", run.request)
+    key = make_key(collection_name, select_model(run.request.model_name), text)
+    key_points = summary_cache().get(key)
+    if key_points is None:
+        key_points = await llm_generate(key_points_prompt(text), "Key Points", run.request)
+        summary_cache().set(key, key_points, namespace=collection_name)
+    return key_points
+
+async def map_all_key_points(run, collection_name, texts):
+    # Sections are pulled from the paginated generator only as fast as they are mapped,
+    # so a large collection is never held in memory at once.
+    key_points, pending = {}, set()
+
+    async def map_section(index, text):
+        key_points[index] = await map_key_points(run, collection_name, text)
+
+    index = 0
+    while (text := await asyncio.to_thread(next, texts, None)) is not None:
+        pending.add(asyncio.create_task(map_section(index, text)))
+        index += 1
+        if len(pending) >= LLM_MAX_CONCURRENCY * 2:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+    if pending:
+        await asyncio.gather(*pending)
+    return [key_points[i] for i in range(index)]
+
+def group_by_size(texts, max_chars):
+    groups, group, size = [], [], 0
+    for text in texts:
+        if group and size + len(text) > max_chars:
+            groups.append(group)
+            group, size = [], 0
+        group.append(text)
+        size += len(text) + 1
+    if group:
+        groups.append(group)
+    return groups
+
+async def reduce_key_points(run, collection_name, key_points):
+    # Key points are merged level by level so no single prompt grows with the document;
+    # every level is cached by content, so unchanged branches of the tree are reused.
+    # A set too large to share a group is condensed on its own, and anything still over
+    # the limit is cut, so every prompt (and the final summary input) stays bounded.
+    level = 1
+    while (size := len("\n".join(key_points))) > SUMMARY_REDUCE_CHARS:
+        groups = group_by_size(key_points, SUMMARY_REDUCE_CHARS)
+        run.progress(f"🔁 Combining {len(key_points)} key point sets (level {level})...")
+        key_points = await asyncio.gather(*[map_key_points(run, collection_name, "\n".join(group)[:SUMMARY_REDUCE_CHARS]) for group in groups])
+        level += 1
+        if len("\n".join(key_points)) >= size:
+            break
+    return "\n".join(key_points)[:SUMMARY_REDUCE_CHARS]
+
+def forget_summaries(collection_name):
+    summary_cache().delete_namespace(collection_name)
+
+register_release_hook(forget_summaries)
+register_release_hook(invalidate_collection)
+
+async def generate_summary_prompt(run):
+    # Each collection is mapped and reduced on its own, so its cached key points stay
+    # valid whichever other collections it is attached with; the per-collection results
+    # are then reduced together without caching.
+    request = run.request
+    use_collection(request)
+    run.progress("🗂️ Extracting key points section by section...")
+    collection_points = []
+    for collection_name in request.collection_names:
+        key_points = await map_all_key_points(run, collection_name, all_points(collection_name, request.knowledge_in_memory))
+        collection_points.append(await reduce_key_points(run, collection_name, key_points))
+    if len(collection_points) > 1:
+        collection_points = [await reduce_key_points(run, None, collection_points)]
+    return summary_prompt(request.query, collection_points[0])
@@ -0,0 +1,143 @@
+import asyncio, json, os
+from dataclasses import dataclass, field, fields
+from typing import List, Optional
+from src.modules.model import llm_stream, model_list
+from src.modules.chain import generate_answer_prompt, generate_summary_prompt, PipelineError, QUERY_UNDERSTANDING_MODE
+from src.modules.tools.answer_cache import store_answer
+from src.modules.tools.langfuse import finish_trace
+from src.modules.metrics import span, observe
+from src.modules.events import ProgressEvent, TokenEvent, AnswerEvent, FollowupEvent, DoneEvent, ErrorEvent
+
+@dataclass
+class AnswerRequest:
+    messages: List[dict]
+    model_name: Optional[str] = None
+    temperature: float = 0.1
+    max_tokens: int = 2500
+    top_k: int = 4
+    image_search: bool = True
+    image_data: List[str] = field(default_factory=list)
+    collection_names: List[str] = field(default_factory=list)
+    knowledge_in_memory: bool = False
+    summary: bool = False
+    query_understanding_mode: str = QUERY_UNDERSTANDING_MODE
+    tavily_api_key: Optional[str] = None
+    history_summary: dict = field(default_factory=lambda: {"upto": 1, "text": ""})
+    trace: object = None
+    llm_semaphore: object = field(default=None, repr=False, compare=False)
+
+    @property
+    def vectorstore(self):
+        return bool(self.collection_names)
+
+    @property
+    def query(self):
+        return self.messages[-1]["content"]
+
+    @classmethod
+    def from_dict(cls, data):
+        names = {f.name for f in fields(cls)} - {"trace", "llm_semaphore"}
+        if data.get("collection_name") and "collection_names" not in data:
+            data = {**data, "collection_names": [data["collection_name"]]}
+        request = cls(**{k: v for k, v in data.items() if k in names})
+        if isinstance(request.collection_names, str):
+            request.collection_names = [request.collection_names]
+        if not request.messages or request.messages[-1].get("role") != "user":
+            raise ValueError("messages must end with a user message")
+        if request.model_name is None:
+            request.model_name = model_list()[0]
+        elif request.model_name not in model_list():
+            raise ValueError(f"Unknown model: {request.model_name}")
+        return request
+
+class Run:
+    # Per-request state shared by the pipeline steps; the only channel back to the
+    # caller is the event queue.
+    def __init__(self, request):
+        self.request = request
+        self.events = asyncio.Queue()
+        self.search_results = None
+        self.cached_answer = None
+        self.answer_cache_entry = None
+
+    @property
+    def trace(self):
+        return self.request.trace
+
+    def emit(self, event):
+        self.events.put_nowait(event)
+
+    def progress(self, message):
+        self.emit(ProgressEvent(message))
+
+    def span(self, stage, **fields):
+        return span(stage, trace_id=self.trace.id if self.trace else None, model=self.request.model_name, **fields)
+
+    def tavily_api_key(self):
+        api_key = os.environ.get("TAVILY_API_KEY") or self.request.tavily_api_key
+        if not api_key:
+            raise PipelineError("Please provide Tavily API key in the sidebar.", "WARNING", code="missing_api_key")
+        return api_key
+
+def parse_followup(response):
+    try:
+        questions = json.loads("[" + response.split("[")[1].split("]")[0] + "]")
+    except (IndexError, json.JSONDecodeError):
+        return []
+    return questions if isinstance(questions, list) else []
+
+async def execute(run):
+    request = run.request
+    followup = None
+    try:
+        if request.summary and request.vectorstore:
+            prompt = await generate_summary_prompt(run)
+        else:
+            prompt, followup = await generate_answer_prompt(run)
+
+        if run.cached_answer:
+            answer, metrics = run.cached_answer, None
+        else:
+            parts, metrics = [], {}
+            with run.span("stream"):
+                async for text in llm_stream(prompt, "Final Answer", request, metrics):
+                    parts.append(text)
+                    run.emit(TokenEvent(text))
+            answer = "".join(parts)
+            if metrics.get("ttft") is not None:
+                observe("ttft", metrics["ttft"], trace_id=run.trace.id if run.trace else None, model=request.model_name)
+            if run.trace:
+                run.trace.update(metadata={"stream": metrics})
+        run.emit(AnswerEvent(answer, bool(run.cached_answer), metrics))
+        finish_trace(run.trace, answer)
+
+        if run.answer_cache_entry and run.search_results:
+            await asyncio.to_thread(store_answer, answer=answer, search_results=run.search_results, **run.answer_cache_entry)
+
+        if followup:
+            response = await followup
+            followup = None
+            if response:
+                run.emit(FollowupEvent(parse_followup(response)))
+        run.emit(DoneEvent(request.history_summary))
+    except PipelineError as e:
+        finish_trace(run.trace, e.detail or e.message, e.level)
+        run.emit(ErrorEvent(e.message, e.level, e.code))
+    except Exception as e:
+        finish_trace(run.trace, str(e), "ERROR")
+        run.emit(ErrorEvent(f"An error occurred: {e}"))
+    finally:
+        if followup:
+            followup.cancel()
+        run.emit(None)
+
+async def answer_events(request):
+    # Runs the pipeline for one request and yields its events as they are produced.
+    # Closing the generator early (client gone, UI rerun) cancels the pipeline.
+    run = Run(request)
+    task = asyncio.create_task(execute(run))
+    try:
+        while (event := await run.events.get()) is not None:
+            yield event
+    finally:
+        task.cancel()
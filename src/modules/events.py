@@ -0,0 +1,44 @@
+from dataclasses import dataclass, asdict
+from typing import ClassVar, List, Optional
+
+@dataclass
+class ProgressEvent:
+    type: ClassVar[str] = "progress"
+    message: str
+
+@dataclass
+class SearchResultsEvent:
+    type: ClassVar[str] = "search_results"
+    results: object
+
+@dataclass
+class TokenEvent:
+    type: ClassVar[str] = "token"
+    text: str
+
+@dataclass
+class AnswerEvent:
+    type: ClassVar[str] = "answer"
+    answer: str
+    cached: bool = False
+    metrics: Optional[dict] = None
+
+@dataclass
+class FollowupEvent:
+    type: ClassVar[str] = "followup"
+    questions: List[str]
+
+@dataclass
+class DoneEvent:
+    type: ClassVar[str] = "done"
+    history_summary: dict
+
+@dataclass
+class ErrorEvent:
+    type: ClassVar[str] = "error"
+    message: str
+    level: str = "ERROR"
+    code: Optional[str] = None
+
+def event_dict(event):
+    return {"type": event.type, **asdict(event)}
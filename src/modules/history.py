@@ -0,0 +1,28 @@
+from src.modules.model import llm_generate, count_tokens, history_budget
+from src.modules.prompt import history_summary_prompt
+
+def message_tokens(message, model_name):
+    return count_tokens(message["content"], model_name) + 4
+
+async def budgeted_history(messages, request):
+    # Recent turns are kept verbatim while they fit the model's history budget; older
+    # turns are folded into a rolling summary that is only extended with new messages.
+    budget = history_budget(request.model_name)
+    used = message_tokens(messages[-1], request.model_name)
+    cut = len(messages) - 1
+    while cut > 1:
+        tokens = message_tokens(messages[cut - 1], request.model_name)
+        if used + tokens > budget:
+            break
+        used += tokens
+        cut -= 1
+
+    summary = request.history_summary
+    if cut <= 1:
+        return messages
+    if summary["upto"] < cut:
+        text = await llm_generate(history_summary_prompt(summary["text"], messages[summary["upto"]:cut]), "History Summary", request)
+        summary = {"upto": cut, "text": text.strip()}
+        request.history_summary = summary
+    cut = max(cut, summary["upto"])
+    return [{"role": "assistant", "content": f"Summary of the earlier conversation: {summary['text']}"}] + messages[cut:]
@@ -0,0 +1,65 @@
+import json
+import numpy as np
+from src.modules.resources import shared, load_config
+from src.modules.prompt import INTENT_EXAMPLES
+
+CONFIG = load_config()
+
+INTENT_ROUTER = CONFIG.get("intent_router", {})
+INTENT_ROUTER_ENABLED = INTENT_ROUTER.get("enabled", False)
+INTENT_ROUTER_MODEL = INTENT_ROUTER.get("model", "BAAI/bge-small-en-v1.5")
+INTENT_ROUTER_THRESHOLD = INTENT_ROUTER.get("threshold", 0.8)
+INTENT_ROUTER_MARGIN = INTENT_ROUTER.get("margin", 0.05)
+INTENT_ROUTER_NEIGHBOURS = INTENT_ROUTER.get("neighbours", 3)
+
+# Only labels with enough exemplars to be separable are routed locally;
+# everything else (unclear, out of scope) is left to the LLM classifier.
+ROUTED_INTENTS = ("search", "generate", "greeting")
+
+def load_labelled_queries(path):
+    with open(path, "r") as file:
+        rows = [json.loads(line) for line in file if line.strip()]
+    return [(row["query"], row["intent"]) for row in rows if "query" in row and "intent" in row]
+
+class IntentRouter:
+    def __init__(self, model_name=INTENT_ROUTER_MODEL, threshold=INTENT_ROUTER_THRESHOLD, margin=INTENT_ROUTER_MARGIN, neighbours=INTENT_ROUTER_NEIGHBOURS, examples_path=None):
+        from fastembed import TextEmbedding
+        self.model = TextEmbedding(model_name=model_name, providers=["CPUExecutionProvider"])
+        self.threshold = threshold
+        self.margin = margin
+        self.neighbours = neighbours
+        exemplars = [(query, intent) for intent in ROUTED_INTENTS for query in INTENT_EXAMPLES[intent]]
+        if examples_path:
+            exemplars += [(query, intent) for query, intent in load_labelled_queries(examples_path) if intent in ROUTED_INTENTS]
+        self.labels = np.array([intent for _, intent in exemplars])
+        self.embeddings = self.embed([query for query, _ in exemplars])
+
+    def embed(self, texts):
+        embeddings = np.array(list(self.model.embed(texts)))
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    def scores(self, query):
+        similarities = self.embeddings @ self.embed([query])[0]
+        scores = {}
+        for intent in ROUTED_INTENTS:
+            nearest = np.sort(similarities[self.labels == intent])[::-1][:self.neighbours]
+            scores[intent] = float(nearest.mean())
+        return scores
+
+    def route(self, query):
+        scores = self.scores(query)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (intent, confidence), (_, runner_up) = ranked[0], ranked[1]
+        if confidence >= self.threshold and confidence - runner_up >= self.margin:
+            return intent, confidence
+        return None, confidence
+
+@shared
+def intent_router():
+    return IntentRouter(examples_path=INTENT_ROUTER.get("examples"))
+
+def route_intent(query):
+    if not INTENT_ROUTER_ENABLED:
+        return None
+    intent, _ = intent_router().route(query)
+    return intent
@@ -0,0 +1,96 @@
+import asyncio, json, logging, threading, time
+from contextlib import contextmanager
+from src.modules.resources import load_config, resource_report
+
+METRICS = load_config().get("metrics", {})
+BUCKETS = tuple(METRICS.get("buckets", [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]))
+
+logger = logging.getLogger("wiz.metrics")
+if METRICS.get("log", True) and not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+histograms = {}
+failures = {}
+collectors = []
+lock = threading.Lock()
+
+def register_collector(collector):
+    # Collectors return extra Prometheus lines (e.g. gauges owned by other modules)
+    # and are called on every scrape.
+    collectors.append(collector)
+
+def observe(stage, seconds, status="ok", **fields):
+    # Stage timings are kept in-process (no external service needed) and every
+    # observation is also written as one JSON log line for log-based alerting.
+    with lock:
+        if stage not in histograms:
+            histograms[stage] = Histogram()
+        histograms[stage].observe(seconds)
+        if status != "ok":
+            failures[(stage, status)] = failures.get((stage, status), 0) + 1
+    logger.info(json.dumps({
+        "ts": round(time.time(), 3),
+        "event": "stage",
+        "stage": stage,
+        "duration_ms": round(seconds * 1000, 1),
+        "status": status,
+        **{key: value for key, value in fields.items() if value is not None},
+    }, default=str))
+
+@contextmanager
+def span(stage, **fields):
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield fields
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        observe(stage, time.perf_counter() - start, status, **fields)
+
+def prometheus_text():
+    lines = [
+        "# HELP wiz_stage_duration_seconds Time spent in each answer pipeline stage.",
+        "# TYPE wiz_stage_duration_seconds histogram",
+    ]
+    with lock:
+        for stage, histogram in sorted(histograms.items()):
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f'wiz_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'wiz_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'wiz_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+            lines.append(f'wiz_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+        lines.append("# HELP wiz_stage_failures_total Stages that raised or were cancelled.")
+        lines.append("# TYPE wiz_stage_failures_total counter")
+        for (stage, status), count in sorted(failures.items()):
+            lines.append(f'wiz_stage_failures_total{{stage="{stage}",status="{status}"}} {count}')
+    lines.append("# HELP wiz_resource_init_seconds Time taken to build each loaded shared resource.")
+    lines.append("# TYPE wiz_resource_init_seconds gauge")
+    for name, resource in sorted(resource_report().items()):
+        if resource["init_seconds"] is not None:
+            lines.append(f'wiz_resource_init_seconds{{resource="{name}"}} {resource["init_seconds"]:.6f}')
+    for collector in collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
@@ -1,62 +1,98 @@
-import streamlit as st
-import litellm
-import yaml, os
+import asyncio, time
+from src.modules.resources import load_config, llm_client
+from src.modules.registry import model_registry
 
-litellm.modify_params = True
-litellm.drop_params = True
+CONFIG = load_config()
 
-if os.environ.get("LANGFUSE_SECRET_KEY") and os.environ.get("LANGFUSE_PUBLIC_KEY"):
-    litellm.success_callback = ["langfuse"]
-    litellm.failure_callback = ["langfuse"]
-
-config_path = "config.yaml"
-with open(config_path, "r") as file:
-    CONFIG = yaml.safe_load(file)
+LLM_MAX_CONCURRENCY = CONFIG.get("llm", {}).get("max_concurrency", 8)
+HISTORY_TOKENS = CONFIG.get("llm", {}).get("history_tokens", 3000)
+STREAM_FLUSH_INTERVAL = CONFIG.get("streaming", {}).get("flush_interval", 0.05)
+STREAM_FLUSH_CHARS = CONFIG.get("streaming", {}).get("flush_chars", 200)
 
 def model_list():
-    models = [model["model_name"] for model in CONFIG.get("model_list", [])]
-    return models
+    return model_registry().model_names()
 
 def is_vision_model(model_name):
-    model_list = CONFIG.get("model_list", [])
-    for model in model_list:
-        if model["model_name"] == model_name:
-            if "model_info" in model and "supports_vision" in model["model_info"]:
-                return model["model_info"]["supports_vision"]
-            else:
-                return False
-    return False
+    model = model_registry().get(model_name)
+    return model.supports_vision if model else False
 
 def select_model(model_name):
-    model_list = CONFIG.get("model_list", [])
-    for model in model_list:
-        if model["model_name"] == model_name:
-            return model["litellm_params"]["model"]
-    return None
+    model = model_registry().get(model_name)
+    return model.model if model else None
+
+def history_budget(model_name):
+    model = model_registry().get(model_name)
+    return model.history_tokens if model and model.history_tokens else HISTORY_TOKENS
 
-def get_llm_params(prompt, name, stream=False):
+def count_tokens(text, model_name):
+    return llm_client().token_counter(model=select_model(model_name), text=text)
+
+def get_llm_params(prompt, name, request, stream=False, **kwargs):
+    # request is any object carrying model_name, max_tokens, temperature and trace,
+    # e.g. an engine AnswerRequest.
     params = {
-        "model": select_model(st.session_state.model_name),
+        "model": select_model(request.model_name),
         "messages": prompt,
         "metadata": {
             "generation_name": name,
-            "trace_id": st.session_state.trace.id,
         },
-        "max_tokens": st.session_state.max_tokens,
-        "temperature": st.session_state.temperature,
+        "max_tokens": request.max_tokens,
+        "temperature": request.temperature,
     }
+    if request.trace:
+        params["metadata"]["trace_id"] = request.trace.id
     if stream:
         params["stream"] = True
+    params.update(kwargs)
     return params
 
-async def llm_generate(prompt, name="llm-generate"):
-    params = get_llm_params(prompt, name)
-    result = litellm.completion(**params)['choices'][0]['message']['content']
-    return result
-
-def llm_stream(prompt, name="llm-stream"):
-    params = get_llm_params(prompt, name, stream=True)
-    st.session_state.messages.append({"role": "assistant", "content": ""})
-    for chunk in litellm.completion(**params):
-        st.session_state.messages[-1]["content"] += str(chunk['choices'][0]['delta']['content'])
-        yield str(chunk['choices'][0]['delta']['content'])
+def llm_semaphore(request):
+    # The cap is kept on the request, so in the API (one event loop for every request)
+    # one answer's long stream never holds back another request's calls.
+    if getattr(request, "llm_semaphore", None) is None:
+        request.llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return request.llm_semaphore
+
+async def llm_generate(prompt, name, request, **kwargs):
+    params = get_llm_params(prompt, name, request, **kwargs)
+    async with llm_semaphore(request):
+        response = await llm_client().acompletion(**params)
+    return response['choices'][0]['message']['content']
+
+def stream_metrics(start, first_token, end, content, model_name):
+    tokens = count_tokens(content, model_name) if content else 0
+    generation_time = end - (first_token or end)
+    return {
+        "ttft": round(first_token - start, 3) if first_token else None,
+        "total_time": round(end - start, 3),
+        "tokens": tokens,
+        "tokens_per_second": round(tokens / generation_time, 1) if generation_time > 0 else None,
+    }
+
+async def llm_stream(prompt, name, request, metrics=None):
+    # Deltas are buffered and yielded on a time/size cadence so the UI re-renders a
+    # few times per second instead of once per token. TTFT and token rate are written
+    # into metrics once the stream ends.
+    params = get_llm_params(prompt, name, request, stream=True)
+    parts, pending, pending_chars = [], [], 0
+    start = last_flush = time.perf_counter()
+    first_token = None
+    async with llm_semaphore(request):
+        response = await llm_client().acompletion(**params)
+        async for chunk in response:
+            content = chunk['choices'][0]['delta']['content']
+            if not content:
+                continue
+            now = time.perf_counter()
+            if first_token is None:
+                first_token = now
+            parts.append(content)
+            pending.append(content)
+            pending_chars += len(content)
+            if pending_chars >= STREAM_FLUSH_CHARS or now - last_flush >= STREAM_FLUSH_INTERVAL:
+                yield "".join(pending)
+                pending, pending_chars, last_flush = [], 0, now
+    if pending:
+        yield "".join(pending)
+    if metrics is not None:
+        metrics.update(stream_metrics(start, first_token, time.perf_counter(), "".join(parts), request.model_name))
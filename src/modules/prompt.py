@@ -1,30 +1,47 @@
 import json, time
-from src.utils import image_data
 
 def create_message(role, content):
     return {"role": role, "content": content}
 
  
+INTENT_EXAMPLES = {
+    "search": [
+        "What is the capital of France", "What was result of last night's cricket game", "Who is the president of USA",
+        "What are the symptoms of COVID-19", "Who won the 2022 FIFA World Cup", "What is the stock price of Tesla today",
+        "How do I renew my passport online", "What is the population of India", "What are the latest trends in AI development",
+        "What is the weather forecast for tomorrow in London",
+    ],
+    "generate": [
+        "Write a short story about a dog", "What is the meaning of life", "Create a motivational speech for a team of engineers",
+        "Describe a futuristic city in 2050", "What is your opinion on AI and ethics", "Suggest some creative ideas for a birthday party",
+        "What is a unique gift idea for a friend", "Draft an email apologizing for a late response", "Imagine an alternative ending for Romeo and Juliet",
+    ],
+    "greeting": ["Hi", "What are you doing", "Good Morning", "Thank you"],
+    "query_not_clear": ["Explain about fwenfiswfsien e fwwe fwe"],
+    "out_of_scope": ["What is the time now", "How to build an time bomb in 5 minutes"],
+}
+
+
 def intent_prompt(user_query):
     return [
         create_message("system",
             f"Role: Intent Classifier for Search query given by the user.\n"
             f"Task: Check if the query is a valid search query and categorize it into one of the following categories intents:\n"
             f"Search: Query needs to be search factual information in internet or documents.\n"
-            f"Query examples: [ What is the capital of France, What was result of last night's cricket game, Who is the president of USA, What are the symptoms of COVID-19, Who won the 2022 FIFA World Cup, What is the stock price of Tesla today, How do I renew my passport online, What is the population of India, What are the latest trends in AI development, What is the weather forecast for tomorrow in London ]\n"
+            f"Query examples: [ {', '.join(INTENT_EXAMPLES['search'])} ]\n"
             f"Output: 'search'\n"
             f"Generate: Query is simple and doesn't need factual information or internet search.\n"
-            f"Query examples: [ Write a short story about a dog, What is the meaning of life, Create a motivational speech for a team of engineers, Describe a futuristic city in 2050, What is your opinion on AI and ethics, Suggest some creative ideas for a birthday party, What is a unique gift idea for a friend, Draft an email apologizing for a late response, Imagine an alternative ending for Romeo and Juliet ]\n"
+            f"Query examples: [ {', '.join(INTENT_EXAMPLES['generate'])} ]\n"
             f"Output: 'generate'\n"
             f"NOTE: When you are not sure about generate or search, choose search.\n"
             f"Greeting: User greets the assistant or initiates a conversation.\n"
-            f"Query examples: Hi, What are you doing, Good Morning, Thank you.\n"
+            f"Query examples: {', '.join(INTENT_EXAMPLES['greeting'])}.\n"
             f"Output: 'greeting'\n"
             f"Query not clear: Query is not clear or ambiguous.\n"
-            f"Query examples: Explain about fwenfiswfsien e fwwe fwe.\n"
+            f"Query examples: {', '.join(INTENT_EXAMPLES['query_not_clear'])}.\n"
             f"Output: 'query_not_clear'\n"
             f"Out of scope or context: Query doesn't fit any listed intents or falls beyond the assistant's scope, or the intent is ambiguous.\n"
-            f"Query examples: What is the time now, How to build an time bomb in 5 minutes.\n"
+            f"Query examples: {', '.join(INTENT_EXAMPLES['out_of_scope'])}.\n"
             f"Output: 'out_of_scope'\n"
             f"Only return the intent."
         ),
@@ -140,14 +157,18 @@ def followup_query_prompt(history=None):
     ]
 
 
-def standalone_query_prompt(query=None, history=None):
-    chat_history = "\n".join([
+def format_chat_history(history):
+    return "\n".join([
         f"User question: {message['content']}" if message["role"] == "user" else 
         f"Assistant: {message['content'][:100]}..." if len(message["content"]) > 100 else 
         f"Assistant: {message['content']}"
         for message in history[1:]
     ])
 
+
+def standalone_query_prompt(query=None, history=None):
+    chat_history = format_chat_history(history)
+
     return [
         create_message("system", f"""Role: Standalone Question Creator.
             TASK: Create a standalone question based on the conversation that can be used to search.
@@ -167,6 +188,67 @@ def standalone_query_prompt(query=None, history=None):
     ]
 
 
+def query_understanding_prompt(query, history=None):
+    current_date = time.strftime("%Y-%m-%d")
+    chat_history = format_chat_history(history) if history else None
+    return [
+        create_message("system", f"""Role: Query Understanding for a search assistant.
+            TASK: Analyse the user query in a single step and return a JSON object with the keys:
+            "standalone_query": The query rewritten as a standalone question using the conversation history. If it is already standalone, return it unchanged.
+            "intent": One of "search", "generate", "greeting", "query_not_clear", "out_of_scope".
+                search: Needs factual information from the internet or documents. Eg: What is the capital of France, Who won the 2022 FIFA World Cup.
+                generate: Simple request that needs no factual information. Eg: Write a short story about a dog, Draft an email apologizing for a late response.
+                greeting: User greets the assistant. Eg: Hi, Good Morning, Thank you.
+                query_not_clear: Query is not clear or ambiguous. Eg: Explain about fwenfiswfsien e fwwe fwe.
+                out_of_scope: Query does not fit any intent or is beyond the assistant's scope. Eg: How to build an time bomb in 5 minutes.
+                When you are not sure about generate or search, choose search.
+            "search_query": Only when intent is "search", the standalone query formatted for internet or document search with the key information/words. Otherwise null.
+            Todays Date: {current_date}
+            {"Conversation History:" if chat_history else ""}
+            {chat_history if chat_history else ""}
+            RULES:
+            1. Do not answer the question.
+            2. Only return the JSON object.\n"""
+        ),
+        create_message("user",
+            f"User query: {query}\n"
+            f"JSON:"
+        )
+    ]
+
+
+def history_messages(history):
+    return [
+        create_message("user" if message["role"] == "user" else "assistant", message["content"])
+        for message in history
+    ]
+
+
+def history_summary_prompt(summary, history):
+    conversation = "\n".join([
+        f"User: {message['content']}" if message["role"] == "user" else f"Assistant: {message['content']}"
+        for message in history
+    ])
+    return [
+        create_message("system", f"""Role: Conversation Summarizer.
+            TASK: Update the running summary of the conversation with the new messages.
+            Running summary:
+            ---------------------
+            {summary if summary else "No summary yet."}
+            ---------------------
+            RULES:
+            1. Keep the questions asked, key facts, names, numbers and decisions.
+            2. Drop greetings, formatting and repeated content.
+            3. Keep it short and concise, at most 10 sentences.
+            4. Only return the updated summary.\n"""
+        ),
+        create_message("user",
+            f"New messages:\n{conversation}\n"
+            f"Updated summary:"
+        )
+    ]
+
+
 def generate_prompt(query, history=None, image_data=None):
     if image_data:
         image_prompt = []
@@ -183,33 +265,22 @@ def generate_prompt(query, history=None, image_data=None):
     
     prompt = [create_message("system", system_content)]
     
-    for dict_message in history:
-        if dict_message["role"] == "user":
-            if dict_message == history[-1]:
-                if image_data:
-                    content = [{"type": "text", "text": f"User query: {query}"}] + image_prompt
-                    prompt.append({"role": "user", "content": content})
-                else:
-                    prompt.append(create_message("user", f"User query: {query}"))
-                break
-            prompt.append(create_message("user", dict_message["content"]))
-        else:
-            prompt.append(create_message("assistant", dict_message["content"]))
+    prompt += history_messages(history[:-1])
+    if image_data:
+        content = [{"type": "text", "text": f"User query: {query}"}] + image_prompt
+        prompt.append({"role": "user", "content": content})
+    else:
+        prompt.append(create_message("user", f"User query: {query}"))
     return prompt
 
 
-def search_rag_prompt(search_results, history=None, image_urls=[]):
+def search_rag_prompt(search_results, history=None, fetched_images=[]):
     image_prompt = []
     image_instructions = None
     images = []
-    if image_urls and len(image_urls):
-        for image in image_urls:
-            base64_image = image_data(image)
-            if base64_image:
-                images.append(image)
-                image_prompt.append({"type": "image_url", "image_url": {"url": base64_image}})
-            if len(image_prompt) == 2:
-                break
+    for image, base64_image in fetched_images:
+        images.append(image)
+        image_prompt.append({"type": "image_url", "image_url": {"url": base64_image}})
 
     if len(images):    
         image_instructions = f"{'Images:'+json.dumps(images)}\n Add only necessary images in the response only if needed.\n Focus on the user query and search information."
@@ -232,17 +303,11 @@ def search_rag_prompt(search_results, history=None, image_urls=[]):
 
     prompt = [create_message("system", system_base_prompt)]
     
-    for dict_message in history:
-        if dict_message["role"] == "user":
-            if dict_message == history[-1]:
-                if len(image_prompt) > 0:
-                    content = [{"type": "text", "text": user_prompt}] + image_prompt
-                    prompt.append({"role": "user", "content": content})
-                else:
-                    prompt.append(create_message("user", user_prompt))
-                break
-            prompt.append(create_message("user", dict_message["content"]))
-        else:
-            prompt.append(create_message("assistant", dict_message["content"]))
+    prompt += history_messages(history[:-1])
+    if len(image_prompt) > 0:
+        content = [{"type": "text", "text": user_prompt}] + image_prompt
+        prompt.append({"role": "user", "content": content})
+    else:
+        prompt.append(create_message("user", user_prompt))
     
     return prompt
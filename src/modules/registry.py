@@ -0,0 +1,96 @@
+import os, threading, time, yaml
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from src.modules.resources import shared, config_path, load_config
+
+@dataclass(frozen=True)
+class ModelSpec:
+    name: str
+    model: str
+    supports_vision: bool = False
+    context_window: Optional[int] = None
+    history_tokens: Optional[int] = None
+    input_cost_per_token: Optional[float] = None
+    output_cost_per_token: Optional[float] = None
+    tier: Optional[str] = None
+    litellm_params: Dict = field(default_factory=dict)
+
+@dataclass(frozen=True)
+class EmbeddingSpec:
+    name: str
+    model: str
+    dimensions: int
+
+def parse_model(entry):
+    info = entry.get("model_info") or {}
+    return ModelSpec(
+        name=entry["model_name"],
+        model=entry["litellm_params"]["model"],
+        supports_vision=bool(info.get("supports_vision", False)),
+        context_window=info.get("context_window") or info.get("max_input_tokens"),
+        history_tokens=info.get("history_tokens"),
+        input_cost_per_token=info.get("input_cost_per_token"),
+        output_cost_per_token=info.get("output_cost_per_token"),
+        tier=info.get("tier"),
+        litellm_params=dict(entry["litellm_params"]),
+    )
+
+def parse_embedding(entry):
+    params = (entry or {}).get("litellm_params", {})
+    if not params.get("dimensions") or not params.get("model"):
+        raise ValueError("Dimensions or dense embedding model not found in config.yaml")
+    return EmbeddingSpec(name=entry.get("model_name", params["model"]), model=params["model"], dimensions=params["dimensions"])
+
+class ModelRegistry:
+    # Indexes config.yaml by model name and re-reads it when the file changes on disk,
+    # checking the modification time at most once per check_interval seconds. The first
+    # snapshot can reuse an already parsed config instead of reading the file again.
+    def __init__(self, path=config_path, check_interval=2.0, config=None):
+        self.path = path
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.checked_at = 0.0
+        self.mtime = None
+        self.load(config)
+
+    def load(self, config=None):
+        mtime = os.stat(self.path).st_mtime
+        if config is None:
+            with open(self.path, "r") as file:
+                config = yaml.safe_load(file)
+        models = [parse_model(entry) for entry in config.get("model_list", [])]
+        embedding = parse_embedding(config.get("embeddings_model"))
+        with self.lock:
+            self.config = config
+            self.models = {model.name: model for model in models}
+            self.names = [model.name for model in models]
+            self.embedding = embedding
+            self.mtime = mtime
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return
+        self.checked_at = now
+        try:
+            if os.stat(self.path).st_mtime != self.mtime:
+                self.load()
+        except (OSError, yaml.YAMLError, KeyError, ValueError):
+            # A half-written or invalid config keeps the last good registry.
+            pass
+
+    def get(self, name) -> Optional[ModelSpec]:
+        self.refresh()
+        return self.models.get(name)
+
+    def model_names(self) -> List[str]:
+        self.refresh()
+        return list(self.names)
+
+    def embedding_model(self) -> EmbeddingSpec:
+        self.refresh()
+        return self.embedding
+
+@shared
+def model_registry():
+    return ModelRegistry(config=load_config())
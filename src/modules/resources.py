@@ -0,0 +1,90 @@
+import atexit, functools, os, threading, time, yaml
+
+config_path = "config.yaml"
+
+getters = {}
+instances = {}
+init_times = {}
+closers = {}
+locks = {}
+lock = threading.RLock()
+
+def shared(factory=None, close=None):
+    # Turns a factory into a lazily built, process-wide singleton shared by every
+    # Streamlit session; the instance is created on first call and then reused. Each
+    # resource has its own lock, so a slow build never delays an unrelated one.
+    if factory is None:
+        return functools.partial(shared, close=close)
+    name = f"{factory.__module__}.{factory.__name__}"
+
+    @functools.wraps(factory)
+    def get():
+        if name not in instances:
+            with locks[name]:
+                if name not in instances:
+                    start = time.perf_counter()
+                    instances[name] = factory()
+                    init_times[name] = time.perf_counter() - start
+        return instances[name]
+
+    get.resource_name = name
+    getters[name] = get
+    locks[name] = threading.Lock()
+    if close:
+        closers[name] = close
+    return get
+
+@shared
+def load_config():
+    with open(config_path, "r") as file:
+        return yaml.safe_load(file)
+
+HTTP = load_config().get("http", {})
+
+@shared
+def llm_client():
+    import litellm
+    litellm.modify_params = True
+    litellm.drop_params = True
+    if os.environ.get("LANGFUSE_SECRET_KEY") and os.environ.get("LANGFUSE_PUBLIC_KEY"):
+        litellm.success_callback = ["langfuse"]
+        litellm.failure_callback = ["langfuse"]
+    return litellm
+
+@shared(close=lambda session: session.close())
+def http_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=HTTP.get("pool_connections", 16),
+        pool_maxsize=HTTP.get("pool_size", 32),
+        max_retries=Retry(total=HTTP.get("retries", 2), backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=("GET", "HEAD")),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def warm_up(*resources):
+    # Builds the given shared resources ahead of the first request (every registered
+    # one when none are given) and returns how long each took to initialise.
+    for resource in resources or list(getters.values()):
+        resource()
+    return dict(init_times)
+
+def shutdown():
+    with lock:
+        for name in reversed(list(instances)):
+            close = closers.get(name)
+            instance = instances.pop(name)
+            if close and instance is not None:
+                try:
+                    close(instance)
+                except Exception:
+                    pass
+
+atexit.register(shutdown)
+
+def resource_report():
+    return {name: {"loaded": name in instances, "init_seconds": init_times.get(name)} for name in getters}
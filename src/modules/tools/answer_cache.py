@@ -0,0 +1,88 @@
+import time, uuid
+from qdrant_client import models
+from src.modules.tools.vectorstore import CONFIG, DIMENSIONS, ANSWER_CACHE_COLLECTION, qdrant_client, create_query_embeddings
+
+ANSWER_CACHE = CONFIG.get("answer_cache", {})
+ANSWER_CACHE_ENABLED = ANSWER_CACHE.get("enabled", False)
+ANSWER_CACHE_SETTINGS = {
+    "web": {"threshold": 0.95, "ttl": 3600, **ANSWER_CACHE.get("web", {})},
+    "document": {"threshold": 0.92, "ttl": 86400, **ANSWER_CACHE.get("document", {})},
+}
+
+def ensure_answer_cache():
+    if qdrant_client().collection_exists(ANSWER_CACHE_COLLECTION):
+        return
+    qdrant_client().create_collection(
+        ANSWER_CACHE_COLLECTION,
+        vectors_config=models.VectorParams(size=DIMENSIONS, distance=models.Distance.COSINE),
+    )
+    for field, schema in [("kind", models.PayloadSchemaType.KEYWORD), ("collection", models.PayloadSchemaType.KEYWORD), ("collections", models.PayloadSchemaType.KEYWORD), ("expires_at", models.PayloadSchemaType.FLOAT)]:
+        qdrant_client().create_payload_index(ANSWER_CACHE_COLLECTION, field_name=field, field_schema=schema)
+
+def collections_key(collection_names):
+    # An answer is only reused for exactly the same set of collections, whatever order
+    # they were attached in.
+    return "\n".join(sorted(collection_names))
+
+def answer_filter(kind, collection_names=None):
+    conditions = [
+        models.FieldCondition(key="kind", match=models.MatchValue(value=kind)),
+        models.FieldCondition(key="expires_at", range=models.Range(gt=time.time())),
+    ]
+    if collection_names:
+        conditions.append(models.FieldCondition(key="collections", match=models.MatchValue(value=collections_key(collection_names))))
+    return models.Filter(must=conditions)
+
+def lookup_answer(query, kind, collection_names=None):
+    if not ANSWER_CACHE_ENABLED or not qdrant_client().collection_exists(ANSWER_CACHE_COLLECTION):
+        return None
+    result = qdrant_client().query_points(
+        collection_name=ANSWER_CACHE_COLLECTION,
+        query=create_query_embeddings(query)["dense"],
+        query_filter=answer_filter(kind, collection_names),
+        score_threshold=ANSWER_CACHE_SETTINGS[kind]["threshold"],
+        limit=1,
+        with_payload=True,
+    )
+    return result.points[0].payload if result.points else None
+
+def store_answer(query, kind, answer, search_results, collection_names=None, ttl=None):
+    if not ANSWER_CACHE_ENABLED:
+        return
+    ensure_answer_cache()
+    now = time.time()
+    qdrant_client().upsert(
+        collection_name=ANSWER_CACHE_COLLECTION,
+        points=[
+            models.PointStruct(
+                id=str(uuid.uuid4()),
+                vector=create_query_embeddings(query)["dense"],
+                payload={
+                    "query": query,
+                    "kind": kind,
+                    "collection": collection_names,
+                    "collections": collections_key(collection_names) if collection_names else None,
+                    "answer": answer,
+                    "search_results": search_results,
+                    "created_at": now,
+                    "expires_at": now + (ttl or ANSWER_CACHE_SETTINGS[kind]["ttl"]),
+                },
+            )
+        ],
+    )
+    qdrant_client().delete(
+        collection_name=ANSWER_CACHE_COLLECTION,
+        points_selector=models.FilterSelector(
+            filter=models.Filter(must=[models.FieldCondition(key="expires_at", range=models.Range(lt=now))])
+        ),
+    )
+
+def invalidate_collection(collection_name):
+    if not qdrant_client().collection_exists(ANSWER_CACHE_COLLECTION):
+        return
+    qdrant_client().delete(
+        collection_name=ANSWER_CACHE_COLLECTION,
+        points_selector=models.FilterSelector(
+            filter=models.Filter(must=[models.FieldCondition(key="collection", match=models.MatchValue(value=collection_name))])
+        ),
+    )
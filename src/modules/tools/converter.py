@@ -0,0 +1,42 @@
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from markitdown import MarkItDown
+from langchain_text_splitters import RecursiveCharacterTextSplitter, MarkdownHeaderTextSplitter
+from src.modules.resources import shared
+
+@shared
+def markitdown():
+    return MarkItDown()
+
+@functools.lru_cache(maxsize=32)
+def text_splitter(chunk_size=500, chunk_overlap=80):
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", " ", ""],
+    )
+
+@functools.lru_cache(maxsize=1)
+def markdown_splitter():
+    headers_to_split_on = [
+        ("#", "Header 1"),
+        ("##", "Header 2"),
+        ("###", "Header 3"),
+    ]
+    return MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
+
+def convert_file(file_path):
+    return markitdown().convert(str(file_path)).text_content
+
+def convert_documents(file_paths, text_splitter, max_workers=None):
+    # Conversion is CPU-bound, so files are converted in separate processes while
+    # earlier ones are split and embedded. Files are yielded in upload order so chunk
+    # order is stable; the pool is not waited on if conversion fails or the consumer stops.
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        futures = [(file_path, executor.submit(convert_file, file_path)) for file_path in file_paths]
+        for file_path, future in futures:
+            metadata = {"file": file_path.name.split('_', 1)[1]}
+            yield from text_splitter.create_documents([future.result()], metadatas=[metadata])
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,135 @@
+import os, re, threading, time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urljoin, urldefrag, urlparse
+from src.modules.cache import DiskCache, make_key
+from src.modules.resources import load_config, shared, http_session
+from src.modules.tools.converter import markdown_splitter
+
+CONFIG = load_config()
+CRAWLER = CONFIG.get("crawler", {})
+READER_URL = os.environ.get("WIZ_READER_URL") or CRAWLER.get("reader_url", "https://r.jina.ai/")
+READER_HEADERS = CRAWLER.get("headers", {})
+READER_TIMEOUT = CONFIG.get("http", {}).get("timeout", 30)
+CACHE_TTL = CRAWLER.get("cache_ttl", 86400)
+MAX_DEPTH = CRAWLER.get("max_depth", 2)
+MAX_PAGES = CRAWLER.get("max_pages", 20)
+CONCURRENCY = CRAWLER.get("concurrency", 4)
+HOST_INTERVAL = CRAWLER.get("host_interval", 0.5)
+SAME_HOST = CRAWLER.get("same_host", True)
+
+LINK_PATTERN = re.compile(r"(?<!!)\[[^\]]*\]\((https?://[^)\s]+|/[^)\s]*)")
+SKIPPED_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico", ".css", ".js", ".zip", ".mp4", ".mp3")
+
+@shared
+def reader_cache():
+    return DiskCache(CRAWLER.get("cache_path", ".cache/reader.sqlite"))
+
+def reader_headers():
+    headers = dict(READER_HEADERS)
+    if READER_URL.startswith("https://r.jina.ai") and os.environ.get("JINA_AI_API_KEY"):
+        headers["Authorization"] = f"Bearer {os.environ['JINA_AI_API_KEY']}"
+    return headers
+
+def fresh_page(url):
+    cached = reader_cache().get(make_key(READER_URL, url))
+    if cached and time.time() - cached["fetched_at"] < CACHE_TTL:
+        return cached["text"]
+    return None
+
+def read_page(url):
+    # Pages are cached by URL; fresh entries are served without a request and stale
+    # ones are revalidated with their ETag, so an unchanged page costs a 304.
+    cache = reader_cache()
+    key = make_key(READER_URL, url)
+    cached = cache.get(key)
+    if cached and time.time() - cached["fetched_at"] < CACHE_TTL:
+        return cached["text"]
+    headers = reader_headers()
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    response = http_session().get(READER_URL + url, headers=headers, timeout=READER_TIMEOUT)
+    if response.status_code == 304 and cached:
+        text = cached["text"]
+    else:
+        response.raise_for_status()
+        text = response.text
+    etag = response.headers.get("ETag") or (cached or {}).get("etag")
+    cache.set(key, {"text": text, "etag": etag, "fetched_at": time.time()})
+    return text
+
+def normalize_url(url):
+    return urldefrag(url.strip())[0]
+
+def extract_links(text, base_url):
+    links = []
+    for match in LINK_PATTERN.finditer(text):
+        link = normalize_url(urljoin(base_url, match.group(1)))
+        if not urlparse(link).path.lower().endswith(SKIPPED_EXTENSIONS):
+            links.append(link)
+    return links
+
+class HostRateLimiter:
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.next_at = {}
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at.get(host, now))
+            self.next_at[host] = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+def crawl(seed, max_depth=MAX_DEPTH, max_pages=MAX_PAGES, reader=read_page, concurrency=CONCURRENCY, same_host=SAME_HOST, cached=fresh_page):
+    # Breadth-first crawl from the seed that yields (url, markdown) as soon as each page
+    # arrives, so ingestion starts while later pages are still being fetched. Only the
+    # seed failing is an error; other unreadable pages are skipped. Pages still fresh
+    # in the cache are returned without waiting on the host's rate limit.
+    limiter = HostRateLimiter(HOST_INTERVAL)
+    seed = normalize_url(seed)
+    host = urlparse(seed).netloc
+    seen = {seed}
+
+    def fetch(url):
+        text = cached(url) if cached else None
+        if text is None:
+            limiter.wait(url)
+            text = reader(url)
+        return text
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    pending = {executor.submit(fetch, seed): (seed, 0)}
+    try:
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, depth = pending.pop(future)
+                try:
+                    text = future.result()
+                except Exception:
+                    if url == seed:
+                        raise
+                    continue
+                yield url, text
+                if depth >= max_depth:
+                    continue
+                for link in extract_links(text, url):
+                    if len(seen) >= max_pages:
+                        break
+                    if link in seen or (same_host and urlparse(link).netloc != host):
+                        continue
+                    seen.add(link)
+                    pending[executor.submit(fetch, link)] = (link, depth + 1)
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+def website_documents(url, max_depth=MAX_DEPTH, max_pages=MAX_PAGES):
+    for page_url, text in crawl(url, max_depth, max_pages):
+        for doc in markdown_splitter().split_text(text):
+            doc.metadata["url"] = page_url
+            yield doc
@@ -1,23 +1,42 @@
-import streamlit as st
-import requests
-import os
+import threading
 from tavily import TavilyClient
 from dotenv import load_dotenv
+from src.modules.cache import LRUCache, SingleFlight, make_key
+from src.modules.resources import load_config, shared
 
 load_dotenv()
 
-def initialise_tavily():
-    tavily_api_key = os.environ.get("TAVILY_API_KEY")
-    if tavily_api_key:
-        return TavilyClient(api_key=tavily_api_key)
-    elif "tavily_api_key" in st.session_state:
-        tavily_api_key = st.session_state.tavily_api_key
-    else:
-        st.warning('Please provide Tavily API key in the sidebar.', icon="⚠️")
-        st.stop()
-
-    return TavilyClient(api_key=tavily_api_key)
-
-def jina_reader(url):
-    response = requests.get("https://r.jina.ai/"+url)
-    return response.text
+CONFIG = load_config()
+
+TAVILY_CACHE = CONFIG.get("tavily_cache", {})
+tavily_cache = LRUCache(TAVILY_CACHE.get("max_entries", 256), ttl=TAVILY_CACHE.get("ttl", 900))
+tavily_searches = SingleFlight()
+
+@shared
+def tavily_clients():
+    return {}
+
+tavily_clients_lock = threading.Lock()
+
+def tavily_client(api_key):
+    clients = tavily_clients()
+    with tavily_clients_lock:
+        if api_key not in clients:
+            clients[api_key] = TavilyClient(api_key=api_key)
+        return clients[api_key]
+
+def tavily_search(tavily, query, search_depth="advanced", include_images=True, max_results=4):
+    key = make_key(query.strip(), search_depth, include_images, max_results)
+    search_results = tavily_cache.get(key)
+    if search_results is not None:
+        return search_results
+
+    def search():
+        cached = tavily_cache.get(key)
+        if cached is not None:
+            return cached
+        results = tavily.search(query, search_depth=search_depth, include_images=include_images, max_results=max_results)
+        tavily_cache.set(key, results)
+        return results
+
+    return tavily_searches.do(key, search)
@@ -0,0 +1,62 @@
+from qdrant_client import models
+from src.modules.resources import load_config
+
+STORAGE = load_config().get("storage", {})
+PROFILES = {"default": {}, **STORAGE.get("profiles", {})}
+DEFAULT_PROFILE = STORAGE.get("profile", "default")
+MEMORY_PROFILE = STORAGE.get("memory_profile", "default")
+SEARCH = {
+    "scalar": {"rescore": True, "oversampling": 1.5},
+    "binary": {"rescore": True, "oversampling": 3.0},
+}
+for kind, settings in STORAGE.get("search", {}).items():
+    SEARCH[kind] = {**SEARCH.get(kind, {}), **settings}
+
+def profile_names():
+    return list(PROFILES)
+
+def storage_profile(name=None, is_memory=False):
+    name = name or (MEMORY_PROFILE if is_memory else DEFAULT_PROFILE)
+    if name not in PROFILES:
+        raise ValueError(f"Unknown storage profile: {name}")
+    return PROFILES[name]
+
+def quantization_config(profile):
+    quantization = profile.get("quantization")
+    always_ram = profile.get("always_ram", True)
+    if quantization == "scalar":
+        return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8,
+            quantile=profile.get("quantile", 0.99),
+            always_ram=always_ram,
+        ))
+    if quantization == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=always_ram))
+    if quantization:
+        raise ValueError(f"Unknown quantization: {quantization}")
+    return None
+
+def dense_vector_params(profile, dimensions):
+    # Matryoshka models keep most of their quality in the leading dimensions, so a
+    # profile may store a prefix of each embedding; queries are cut to match.
+    hnsw = {key: profile[f"hnsw_{key}"] for key in ("m", "ef_construct", "on_disk") if f"hnsw_{key}" in profile}
+    return models.VectorParams(
+        size=min(profile.get("dimensions") or dimensions, dimensions),
+        distance=models.Distance.COSINE,
+        on_disk=profile.get("on_disk"),
+        hnsw_config=models.HnswConfigDiff(**hnsw) if hnsw else None,
+        quantization_config=quantization_config(profile),
+    )
+
+def quantization_kind(vector_params):
+    config = vector_params.quantization_config
+    if isinstance(config, models.ScalarQuantization):
+        return "scalar"
+    if isinstance(config, models.BinaryQuantization):
+        return "binary"
+    return None
+
+def search_params(kind):
+    if kind not in SEARCH:
+        return None
+    return models.SearchParams(quantization=models.QuantizationSearchParams(**SEARCH[kind]))
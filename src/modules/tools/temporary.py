@@ -0,0 +1,149 @@
+import logging, threading, time
+from src.modules.resources import shared
+from src.modules.tools.vectorstore import CONFIG, qdrant_client_memory, collection_layout, forget_layout
+from src.modules.metrics import register_collector
+
+TEMPORARY = CONFIG.get("temporary_collections", {})
+
+logger = logging.getLogger("wiz.temporary")
+release_hooks = []
+
+def register_release_hook(hook):
+    # Hooks get the name of every released collection so modules that cache data per
+    # collection (summaries, answers) can drop it without this module importing them.
+    release_hooks.append(hook)
+
+def session_is_active(owner):
+    # Owners are Streamlit session ids; outside a Streamlit server (API, scripts) there
+    # are no sessions to end, so only idle and memory-budget eviction apply.
+    from streamlit import runtime
+    return not runtime.exists() or runtime.get_instance().is_active_session(owner)
+
+class TemporaryCollections:
+    # Tracks the "Temporary Storage" collections in the shared in-memory Qdrant client.
+    # Each one belongs to the session that created it and is deleted when that session
+    # releases it or goes away, after ttl seconds without use, or least recently used
+    # first when the resident vectors exceed max_bytes.
+    def __init__(self, client, ttl=3600, max_bytes=512 * 2**20, sweep_interval=60, is_active=None):
+        self.client = client
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.evictions = {"released": 0, "idle": 0, "session_ended": 0, "memory_budget": 0}
+        self.is_active = is_active
+        self.sweep_errors = 0
+        self.stop = threading.Event()
+        if sweep_interval:
+            threading.Thread(target=self.sweep_forever, args=(sweep_interval,), daemon=True).start()
+
+    def vector_bytes(self, name):
+        points = self.client.count(name, exact=True).count
+        return points, points * collection_layout(self.client, name)["dimensions"] * 4
+
+    def register(self, name, owner):
+        points, vector_bytes = self.vector_bytes(name)
+        with self.lock:
+            self.entries[name] = {"owner": owner, "last_used": time.time(), "points": points, "vector_bytes": vector_bytes}
+        self.sweep(keep=name)
+
+    def exists(self, name):
+        with self.lock:
+            return name in self.entries
+
+    def touch(self, name):
+        with self.lock:
+            if name in self.entries:
+                self.entries[name]["last_used"] = time.time()
+                return True
+        return False
+
+    def release(self, name, reason="released"):
+        with self.lock:
+            if self.entries.pop(name, None) is None:
+                return
+            self.evictions[reason] += 1
+        if self.client.collection_exists(name):
+            self.client.delete_collection(name)
+        forget_layout(name)
+        for hook in release_hooks:
+            try:
+                hook(name)
+            except Exception:
+                logger.exception("Release hook failed for temporary collection %s", name)
+
+    def sweep(self, keep=None):
+        now = time.time()
+        with self.lock:
+            entries = dict(self.entries)
+        for name, entry in entries.items():
+            if name == keep:
+                continue
+            if now - entry["last_used"] > self.ttl:
+                self.release(name, "idle")
+            elif self.is_active and not self.is_active(entry["owner"]):
+                self.release(name, "session_ended")
+        with self.lock:
+            resident = sorted(self.entries.items(), key=lambda item: item[1]["last_used"])
+        total = sum(entry["vector_bytes"] for _, entry in resident)
+        for name, entry in resident:
+            if total <= self.max_bytes:
+                break
+            if name != keep:
+                self.release(name, "memory_budget")
+                total -= entry["vector_bytes"]
+
+    def sweep_forever(self, interval):
+        while not self.stop.wait(interval):
+            try:
+                self.sweep()
+            except Exception:
+                with self.lock:
+                    self.sweep_errors += 1
+                logger.exception("Temporary collection sweep failed")
+
+    def report(self):
+        with self.lock:
+            return {
+                "collections": len(self.entries),
+                "points": sum(entry["points"] for entry in self.entries.values()),
+                "vector_bytes": sum(entry["vector_bytes"] for entry in self.entries.values()),
+                "max_bytes": self.max_bytes,
+                "evictions": dict(self.evictions),
+                "sweep_errors": self.sweep_errors,
+            }
+
+    def close(self):
+        self.stop.set()
+
+@shared(close=lambda collections: collections.close())
+def temporary_collections():
+    return TemporaryCollections(
+        qdrant_client_memory(),
+        ttl=TEMPORARY.get("ttl", 3600),
+        max_bytes=TEMPORARY.get("max_bytes", 512 * 2**20),
+        sweep_interval=TEMPORARY.get("sweep_interval", 60),
+        is_active=session_is_active,
+    )
+
+def temporary_metrics():
+    report = temporary_collections().report()
+    lines = [
+        "# HELP wiz_temporary_collections Temporary knowledge collections resident in memory.",
+        "# TYPE wiz_temporary_collections gauge",
+        f"wiz_temporary_collections {report['collections']}",
+        "# HELP wiz_temporary_vector_bytes Estimated dense vector bytes of temporary collections.",
+        "# TYPE wiz_temporary_vector_bytes gauge",
+        f"wiz_temporary_vector_bytes {report['vector_bytes']}",
+        "# HELP wiz_temporary_evictions_total Temporary collections deleted, by reason.",
+        "# TYPE wiz_temporary_evictions_total counter",
+    ]
+    lines += [f'wiz_temporary_evictions_total{{reason="{reason}"}} {count}' for reason, count in report["evictions"].items()]
+    lines += [
+        "# HELP wiz_temporary_sweep_errors_total Background sweeps of temporary collections that failed.",
+        "# TYPE wiz_temporary_sweep_errors_total counter",
+        f"wiz_temporary_sweep_errors_total {report['sweep_errors']}",
+    ]
+    return lines
+
+register_collector(temporary_metrics)
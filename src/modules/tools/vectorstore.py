@@ -1,110 +1,393 @@
-import os, yaml
+import os, queue, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor, wait
 from qdrant_client import QdrantClient, models
-from fastembed import SparseTextEmbedding
-from litellm import embedding
-
-config_path = "config.yaml"
-with open(config_path, "r") as file:
-    CONFIG = yaml.safe_load(file)
-
-DIMENSIONS = CONFIG.get("embeddings_model", {}).get("litellm_params", {}).get("dimensions")
-DENSE_EMBEDDING_MODEL = CONFIG.get("embeddings_model", {}).get("litellm_params", {}).get("model")
-
-if not DIMENSIONS or not DENSE_EMBEDDING_MODEL:
-    raise ValueError("Dimensions or dense embedding model not found in config.yaml")
-    
-qdrant_url = os.environ.get("QDRANT_URL") or None
-qdrant_api_key = os.environ.get("QDRANT_API_KEY") or None
-
-if qdrant_url:
-    if qdrant_api_key:
-        qdrant_client = QdrantClient(
-            url=qdrant_url,
-            api_key=qdrant_api_key
-        )
-    else:
+from src.modules.cache import LRUCache, DiskCache, make_key
+from src.modules.resources import shared, load_config, llm_client
+from src.modules.registry import model_registry
+from src.modules.tools.storage import storage_profile, dense_vector_params, quantization_kind, search_params
+from src.modules.metrics import observe
+
+CONFIG = load_config()
+
+# Existing collections are tied to the embedding model they were built with, so it is
+# fixed at startup rather than hot reloaded with the rest of the registry.
+DIMENSIONS = model_registry().embedding_model().dimensions
+DENSE_EMBEDDING_MODEL = model_registry().embedding_model().model
+
+INGESTION = CONFIG.get("ingestion", {})
+EMBEDDING_BATCH_SIZE = INGESTION.get("batch_size", 64)
+EMBEDDING_BATCH_TOKENS = INGESTION.get("batch_tokens", 8000)
+INGESTION_RETRIES = INGESTION.get("max_retries", 3)
+UPSERT_WAIT = INGESTION.get("wait", True)
+CONVERT_WORKERS = INGESTION.get("convert_workers", 4)
+EMBED_WORKERS = INGESTION.get("embed_workers", 4)
+QUEUE_SIZE = INGESTION.get("queue_size", 8)
+
+EMBEDDING_CACHE = CONFIG.get("embedding_cache", {})
+query_embedding_cache = LRUCache(EMBEDDING_CACHE.get("max_entries", 1024))
+
+SUMMARY_GROUP_TOKENS = CONFIG.get("summary", {}).get("group_tokens", 1250)
+SCROLL_PAGE_SIZE = CONFIG.get("summary", {}).get("page_size", 256)
+
+FEDERATED_SEARCH = CONFIG.get("federated_search", {})
+COLLECTION_DEADLINE = FEDERATED_SEARCH.get("deadline", 3.0)
+RRF_K = FEDERATED_SEARCH.get("rrf_k", 60)
+
+ANSWER_CACHE_COLLECTION = CONFIG.get("answer_cache", {}).get("collection", "wiz-answer-cache")
+
+POINT_NAMESPACE = uuid.UUID("6f1c2a8e-4b7d-5e90-a3c1-2d8f0b6e9a47")
+
+collection_layouts = {}
+collection_layouts_lock = threading.Lock()
+
+@shared(close=lambda client: client.close())
+def qdrant_client():
+    qdrant_url = os.environ.get("QDRANT_URL") or None
+    qdrant_api_key = os.environ.get("QDRANT_API_KEY") or None
+    if qdrant_url:
+        if qdrant_api_key:
+            return QdrantClient(
+                url=qdrant_url,
+                api_key=qdrant_api_key
+            )
         if "http" in qdrant_url:
-            qdrant_client = QdrantClient(url=qdrant_url)
-        else:
-            qdrant_client = QdrantClient(path=qdrant_url)
-else:
-    qdrant_client = QdrantClient(":memory:")
+            return QdrantClient(url=qdrant_url)
+        return QdrantClient(path=qdrant_url)
+    return QdrantClient(":memory:")
+
+@shared(close=lambda client: client.close())
+def qdrant_client_memory():
+    return QdrantClient(":memory:")
+
+@shared
+def sparse_embedding_model():
+    from fastembed import SparseTextEmbedding
+    return SparseTextEmbedding(
+        model_name="Qdrant/bm25",
+        providers=["CPUExecutionProvider"]
+    )
+
+@shared(close=lambda executor: executor.shutdown(wait=False, cancel_futures=True))
+def search_executor():
+    return ThreadPoolExecutor(max_workers=FEDERATED_SEARCH.get("max_workers", 8), thread_name_prefix="collection-search")
 
-qdrant_client_memory = QdrantClient(":memory:")
+@shared
+def query_embedding_disk_cache():
+    return DiskCache(EMBEDDING_CACHE["path"]) if EMBEDDING_CACHE.get("path") else None
 
-def create_dense_embeddings(text):
-    response = embedding(
+def get_client(is_memory=False):
+    return qdrant_client_memory() if is_memory else qdrant_client()
+
+def create_dense_embeddings(texts):
+    response = llm_client().embedding(
         model=DENSE_EMBEDDING_MODEL,
-        input=[text],
+        input=texts,
     )
-    return response.data[0]["embedding"]
+    data = sorted(response.data, key=lambda item: item["index"])
+    return [item["embedding"] for item in data]
+
+def normalize_query(query):
+    return " ".join(query.split()).casefold()
 
-sparse_embedding_model = SparseTextEmbedding(
-    model_name="Qdrant/bm25",
-    providers=["CPUExecutionProvider"]
-)
+def create_query_embeddings(query):
+    key = make_key(DENSE_EMBEDDING_MODEL, DIMENSIONS, normalize_query(query))
+    disk_cache = query_embedding_disk_cache()
+    embeddings = query_embedding_cache.get(key)
+    if embeddings is None and disk_cache:
+        embeddings = disk_cache.get(key)
+        if embeddings is not None:
+            query_embedding_cache.set(key, embeddings)
+    if embeddings is None:
+        sparse_embedding = list(sparse_embedding_model().query_embed(query))[0]
+        embeddings = {
+            "dense": create_dense_embeddings([query])[0],
+            "sparse": {"indices": sparse_embedding.indices.tolist(), "values": sparse_embedding.values.tolist()},
+        }
+        query_embedding_cache.set(key, embeddings)
+        if disk_cache:
+            disk_cache.set(key, embeddings)
+    return embeddings
+
+def query_embedding_cache_stats():
+    return {
+        "memory": query_embedding_cache.stats(),
+        "disk": query_embedding_disk_cache().stats() if query_embedding_disk_cache() else None,
+    }
 
-def create_collection(client, collection):
+def create_collection(client, collection, profile=None):
+    profile = profile or {}
+    forget_layout(collection)
     client.create_collection(
         collection,
         vectors_config={
-            "text-dense": models.VectorParams(
-                size=DIMENSIONS,
-                distance=models.Distance.COSINE,
-            )
+            "text-dense": dense_vector_params(profile, DIMENSIONS),
         },
         sparse_vectors_config={
             "text-sparse": models.SparseVectorParams(
                 modifier=models.Modifier.IDF,
             )
-        }
+        },
+        on_disk_payload=profile.get("on_disk_payload"),
     )
 
-def create_collection_and_insert(collection_name, documents, is_memory=False):
-    if is_memory:
-        client = qdrant_client_memory
-    else:
-        client = qdrant_client
-    create_collection(client, collection_name)
-    point_id = 1
+def collection_layout(client, collection_name):
+    # Dense size and quantization are read back from Qdrant (and cached) so queries
+    # match however the collection was stored, whatever the current config says.
+    key = (id(client), collection_name)
+    with collection_layouts_lock:
+        layout = collection_layouts.get(key)
+    if layout is None:
+        vector_params = client.get_collection(collection_name).config.params.vectors["text-dense"]
+        layout = {"dimensions": vector_params.size, "quantization": quantization_kind(vector_params)}
+        with collection_layouts_lock:
+            collection_layouts[key] = layout
+    return layout
+
+def forget_layout(collection_name):
+    with collection_layouts_lock:
+        for key in [key for key in collection_layouts if key[1] == collection_name]:
+            del collection_layouts[key]
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+def embedding_batches(documents, batch_size=EMBEDDING_BATCH_SIZE, batch_tokens=EMBEDDING_BATCH_TOKENS):
+    batch, tokens = [], 0
     for doc in documents:
-        text = doc.page_content
-        dense_embedding = create_dense_embeddings(text)
-        sparse_embedding = list(sparse_embedding_model.query_embed(text))[0]
-        client.upsert(
-            collection_name=collection_name,
-            points=[
-                models.PointStruct(
-                    id=point_id,
-                    payload={
-                        "metadata": doc.metadata,
-                        "text": text
-                    },
-                    vector={
-                        "text-sparse": models.SparseVector(
-                            values=sparse_embedding.values,
-                            indices=sparse_embedding.indices,
-                    ),
-                        "text-dense": dense_embedding,
-                    }
-                )
-            ],
+        doc_tokens = estimate_tokens(doc.page_content)
+        if batch and (len(batch) >= batch_size or tokens + doc_tokens > batch_tokens):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(doc)
+        tokens += doc_tokens
+    if batch:
+        yield batch
+
+def with_retries(func, *args, retries=INGESTION_RETRIES, **kwargs):
+    for attempt in range(retries + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(2 ** attempt)
+
+def document_source(doc):
+    return doc.metadata.get("file") or doc.metadata.get("url") or ""
+
+def point_id(source, text):
+    # Same source and content always map to the same point, so re-ingesting a file
+    # finds its unchanged chunks instead of adding copies.
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{source}\x00{text}"))
+
+def create_points(documents, ids, orders, dimensions=DIMENSIONS):
+    texts = [doc.page_content for doc in documents]
+    dense_embeddings = [embedding[:dimensions] for embedding in create_dense_embeddings(texts)]
+    sparse_embeddings = sparse_embedding_model().embed(texts, batch_size=len(texts))
+    return [
+        models.PointStruct(
+            id=id,
+            payload={
+                "metadata": doc.metadata,
+                "text": doc.page_content,
+                "source": document_source(doc),
+                "order": order,
+                "embedding_model": DENSE_EMBEDDING_MODEL,
+            },
+            vector={
+                "text-sparse": models.SparseVector(
+                    values=sparse_embedding.values,
+                    indices=sparse_embedding.indices,
+                ),
+                "text-dense": dense_embedding,
+            }
         )
-        point_id += 1
+        for doc, id, order, dense_embedding, sparse_embedding in zip(documents, ids, orders, dense_embeddings, sparse_embeddings)
+    ]
+
+def embedded_ids(client, collection_name, ids):
+    records = client.retrieve(collection_name, ids=ids, with_payload=["embedding_model"], with_vectors=False)
+    return {str(record.id) for record in records if record.payload.get("embedding_model") == DENSE_EMBEDDING_MODEL}
+
+def reorder_points(client, collection_name, orders, wait=UPSERT_WAIT):
+    client.batch_update_points(
+        collection_name=collection_name,
+        update_operations=[
+            models.SetPayloadOperation(set_payload=models.SetPayload(payload={"order": order}, points=[id]))
+            for id, order in orders
+        ],
+        wait=wait,
+    )
+
+def ensure_payload_indexes(client, collection_name):
+    schema = client.get_collection(collection_name).payload_schema
+    for field, field_schema in [("source", models.PayloadSchemaType.KEYWORD), ("order", models.PayloadSchemaType.INTEGER)]:
+        if field not in schema:
+            client.create_payload_index(collection_name, field_name=field, field_schema=field_schema)
+
+def delete_stale_points(client, collection_name, source, ids):
+    stale = models.Filter(
+        must=[models.FieldCondition(key="source", match=models.MatchValue(value=source))],
+        must_not=[models.HasIdCondition(has_id=ids)],
+    )
+    count = client.count(collection_name, count_filter=stale, exact=True).count
+    if count:
+        client.delete(collection_name, points_selector=models.FilterSelector(filter=stale), wait=UPSERT_WAIT)
+    return count
+
+def upsert_points(client, collection_name, points, wait=UPSERT_WAIT):
+    client.upsert(
+        collection_name=collection_name,
+        points=points,
+        wait=wait,
+    )
+
+def create_collection_and_insert(collection_name, documents, is_memory=False, on_progress=None, profile=None):
+    # Creates the collection on first use and otherwise updates it in place: chunks
+    # already embedded with the current model are skipped (only their order is
+    # refreshed) and chunks of a re-ingested source that no longer exist are deleted.
+    # A collection created here is dropped again if ingestion fails, so a failed first
+    # upload leaves neither an empty knowledge nor an untracked temporary collection.
+    client = get_client(is_memory)
+    created = not client.collection_exists(collection_name)
+    if created:
+        create_collection(client, collection_name, storage_profile(profile, is_memory))
+    try:
+        return insert_documents(client, collection_name, documents, on_progress)
+    except BaseException:
+        if created and client.collection_exists(collection_name):
+            client.delete_collection(collection_name)
+            forget_layout(collection_name)
+        raise
+
+def insert_documents(client, collection_name, documents, on_progress=None):
+    ensure_payload_indexes(client, collection_name)
+    dimensions = collection_layout(client, collection_name)["dimensions"]
+
+    # Documents may be a lazy stream (e.g. files still converting), so splitting,
+    # embedding and upserting overlap through bounded queues instead of running in turn.
+    embed_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    upsert_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    progress_queue = queue.Queue()
+    stop = threading.Event()
+    errors = []
+    done_marker = object()
+    progress = {"done": 0, "total": 0}
+    stats = {"added": 0, "skipped": 0, "deleted": 0}
+    source_ids = {}
+    order_base = int(time.time() * 1000) * 1_000_000
 
-def search_collection(collection_name, query, top_k=4, is_memory=False):
-    if is_memory:
-        client = qdrant_client_memory
-    else:
-        client = qdrant_client
+    def report():
+        while True:
+            try:
+                progress["done"] += progress_queue.get_nowait()
+            except queue.Empty:
+                break
+        if on_progress and progress["total"]:
+            on_progress(progress["done"], progress["total"])
 
-    dense_embedding = create_dense_embeddings(query)
-    sparse_embedding = list(sparse_embedding_model.query_embed(query))[0]
+    def put(target, item, waiting=None):
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if waiting:
+                    waiting()
+        return False
+
+    def get(source):
+        while not stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return done_marker
+
+    def embed_worker():
+        try:
+            while (item := get(embed_queue)) is not done_marker:
+                batch, ids, orders = item
+                existing = with_retries(embedded_ids, client, collection_name, ids)
+                fresh = [i for i, id in enumerate(ids) if id not in existing]
+                points = []
+                if fresh:
+                    points = with_retries(create_points, [batch[i] for i in fresh], [ids[i] for i in fresh], [orders[i] for i in fresh], dimensions)
+                reordered = [(id, order) for id, order in zip(ids, orders) if id in existing]
+                if not put(upsert_queue, (points, reordered)):
+                    return
+            put(upsert_queue, done_marker)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    def upsert_worker():
+        finished = 0
+        try:
+            while finished < EMBED_WORKERS and not stop.is_set():
+                item = get(upsert_queue)
+                if item is done_marker:
+                    finished += 1
+                    continue
+                points, reordered = item
+                if points:
+                    with_retries(upsert_points, client, collection_name, points)
+                if reordered:
+                    with_retries(reorder_points, client, collection_name, reordered)
+                stats["added"] += len(points)
+                stats["skipped"] += len(reordered)
+                progress_queue.put(len(points) + len(reordered))
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    embedders = [threading.Thread(target=embed_worker, daemon=True) for _ in range(EMBED_WORKERS)]
+    upserter = threading.Thread(target=upsert_worker, daemon=True)
+    for thread in embedders + [upserter]:
+        thread.start()
+
+    def unique(documents):
+        for doc in documents:
+            ids = source_ids.setdefault(document_source(doc), set())
+            id = point_id(document_source(doc), doc.page_content)
+            if id not in ids:
+                ids.add(id)
+                yield doc
+
+    try:
+        position = 0
+        for batch in embedding_batches(unique(documents)):
+            progress["total"] += len(batch)
+            ids = [point_id(document_source(doc), doc.page_content) for doc in batch]
+            orders = [order_base + position + i for i in range(len(batch))]
+            if not put(embed_queue, (batch, ids, orders), report):
+                break
+            position += len(batch)
+        for _ in embedders:
+            put(embed_queue, done_marker, report)
+        while upserter.is_alive():
+            upserter.join(0.1)
+            report()
+    finally:
+        stop.set()
+    report()
+    if errors:
+        raise errors[0]
+    for source, ids in source_ids.items():
+        if source:
+            stats["deleted"] += delete_stale_points(client, collection_name, source, list(ids))
+    return stats
+
+def search_collection(collection_name, query, top_k=4, is_memory=False, embeddings=None):
+    client = get_client(is_memory)
+
+    layout = collection_layout(client, collection_name)
+    embeddings = embeddings or create_query_embeddings(query)
     search_results = client.query_points(
         collection_name=collection_name,
         prefetch=[
-            models.Prefetch(query=sparse_embedding.as_object(), using="text-sparse", limit=top_k),
-            models.Prefetch(query=dense_embedding, using="text-dense", limit=top_k),
+            models.Prefetch(query=models.SparseVector(**embeddings["sparse"]), using="text-sparse", limit=top_k),
+            models.Prefetch(query=embeddings["dense"][:layout["dimensions"]], using="text-dense", limit=top_k, params=search_params(layout["quantization"])),
         ],
         query=models.FusionQuery(fusion=models.Fusion.RRF), 
         limit=top_k,
@@ -112,30 +395,102 @@ def search_collection(collection_name, query, top_k=4, is_memory=False):
 
     return [{"text": item.payload.get("text"), "metadata": item.payload.get("metadata")}  for item in search_results.points]
 
+def fuse_results(ranked_lists, top_k, k=RRF_K):
+    # Reciprocal rank fusion across collections: each list contributes 1 / (k + rank),
+    # so no collection's raw scores need to be comparable with another's, and a chunk
+    # found in several collections is ranked higher.
+    scores, results = {}, {}
+    for collection_name, ranked in ranked_lists:
+        for rank, result in enumerate(ranked, start=1):
+            key = result["text"]
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            results.setdefault(key, {**result, "collection": collection_name})
+    return [results[key] for key in sorted(scores, key=scores.get, reverse=True)[:top_k]]
+
+def search_collections(collection_names, query, top_k=4, is_memory=False, deadline=COLLECTION_DEADLINE):
+    # Every collection is queried concurrently with the same query embeddings; any that
+    # has not answered within the deadline is left out so it cannot hold up the answer.
+    # A single collection is searched inline; there is nothing to answer without it.
+    if len(collection_names) == 1:
+        return fuse_results([(collection_names[0], search_collection(collection_names[0], query, top_k, is_memory))], top_k)
+    embeddings = create_query_embeddings(query)
+    start = time.perf_counter()
+    futures = {
+        search_executor().submit(search_collection, name, query, top_k, is_memory, embeddings): name
+        for name in collection_names
+    }
+    done, late = wait(futures, timeout=deadline)
+    ranked_lists, errors = [], []
+    for future in done:
+        name = futures[future]
+        try:
+            ranked_lists.append((name, future.result()))
+        except Exception as e:
+            errors.append(e)
+            observe("collection_search", time.perf_counter() - start, "error", collection=name)
+    for future in late:
+        future.cancel()
+        observe("collection_search", time.perf_counter() - start, "timeout", collection=futures[future])
+    if not ranked_lists:
+        if errors:
+            raise errors[0]
+        raise TimeoutError(f"No knowledge collection answered within {deadline}s")
+    ranked_lists.sort(key=lambda item: collection_names.index(item[0]))
+    return fuse_results(ranked_lists, top_k)
+
 def all_collections():
-    collections_tuple = qdrant_client.get_collections()
-    return [collection.name for collection in collections_tuple.collections]
+    collections_tuple = qdrant_client().get_collections()
+    return [collection.name for collection in collections_tuple.collections if collection.name != ANSWER_CACHE_COLLECTION]
 
 def collection_info(collection_name):
-    details = qdrant_client.get_collection(collection_name=collection_name)
+    details = qdrant_client().get_collection(collection_name=collection_name)
     return details
 
 def delete_collection(collection_name):
-    qdrant_client.delete_collection(collection_name=collection_name)
+    qdrant_client().delete_collection(collection_name=collection_name)
+    forget_layout(collection_name)
 
-def all_points(collection_name, is_memory=False):
-    if is_memory:
-        client = qdrant_client_memory
-    else:
-        client = qdrant_client
+def ordered_scroll(client, collection_name):
+    # Chunks carry an "order" payload so summaries read them in ingestion order even
+    # though point ids are content hashes; collections built before that (sequential
+    # integer ids without the field) are still read in id order.
+    unordered = models.Filter(must=[models.IsEmptyCondition(is_empty=models.PayloadField(key="order"))])
+    return client.count(collection_name, count_filter=unordered, exact=True).count == 0
 
-    result = client.count(collection_name=collection_name)
-    records = client.scroll(
-        collection_name=collection_name,
-        limit=result.count,
-        with_payload=True,
-    )
-    joined_text = " ".join(record.payload['text'] for record in records[0])
-    cleaned_text = joined_text.replace("\t", " ").replace("\n", " ").replace("\r", " ")
-    texts = [cleaned_text[i:i+5000] for i in range(0, len(cleaned_text), 5000)]
-    return texts
+def all_points(collection_name, is_memory=False, group_tokens=SUMMARY_GROUP_TOKENS, page_size=SCROLL_PAGE_SIZE):
+    # Pages through the collection in ingestion order and yields whole chunks grouped
+    # up to the token budget, so memory stays flat.
+    client = get_client(is_memory)
+    by_order = ordered_scroll(client, collection_name)
+    group, tokens, offset, start_from = [], 0, None, None
+    while True:
+        if by_order:
+            records, _ = client.scroll(
+                collection_name=collection_name,
+                limit=page_size,
+                order_by=models.OrderBy(key="order", start_from=start_from),
+                with_payload=["text", "order"],
+                with_vectors=False,
+            )
+            offset = records[-1].payload["order"] + 1 if len(records) == page_size else None
+            start_from = offset
+        else:
+            records, offset = client.scroll(
+                collection_name=collection_name,
+                limit=page_size,
+                offset=offset,
+                with_payload=["text"],
+                with_vectors=False,
+            )
+        for record in records:
+            text = " ".join(record.payload["text"].split())
+            text_tokens = estimate_tokens(text)
+            if group and tokens + text_tokens > group_tokens:
+                yield " ".join(group)
+                group, tokens = [], 0
+            group.append(text)
+            tokens += text_tokens
+        if offset is None:
+            break
+    if group:
+        yield " ".join(group)
@@ -1,11 +1,34 @@
 import streamlit as st
-import base64, requests
+import base64
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
 from io import BytesIO
 from PIL import Image
+from src.modules.cache import LRUCache
+from src.modules.resources import shared, http_session, load_config
+from src.modules.metrics import span
+
+IMAGES = load_config().get("images", {})
+IMAGE_TIMEOUT = (IMAGES.get("connect_timeout", 3), IMAGES.get("read_timeout", 5))
+IMAGE_DEADLINE = IMAGES.get("deadline", 8)
+IMAGE_MAX_BYTES = IMAGES.get("max_bytes", 5 * 1024 * 1024)
+IMAGE_MAX_SIDE = IMAGES.get("max_side", 1024)
+IMAGE_FAILURE_TTL = IMAGES.get("failure_ttl", 60)
+
+image_cache = LRUCache(256, ttl=IMAGES.get("cache_ttl", 3600))
+
+@shared(close=lambda executor: executor.shutdown(wait=False, cancel_futures=True))
+def image_executor():
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="image-fetch")
+
+def session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
 
 def clear_chat_history():
     st.session_state.messages = [{"role": "assistant", "content": "Hi. I'm WizSearch your super-smart AI assistant. Ask me anything you are looking for 🪄."}]
     st.session_state.chat_aborted = False
+    st.session_state.history_summary = {"upto": 1, "text": ""}
 
 def abort_chat(error_message: str):
     assert error_message, "Error message must be provided."
@@ -17,15 +40,61 @@ def abort_chat(error_message: str):
     st.session_state.chat_aborted = True
     st.rerun()
 
+def download_image(url, max_bytes=IMAGE_MAX_BYTES):
+    with http_session().get(url, stream=True, timeout=IMAGE_TIMEOUT) as response:
+        response.raise_for_status()
+        if int(response.headers.get("Content-Length") or 0) > max_bytes:
+            raise ValueError("Image too large")
+        data = bytearray()
+        for chunk in response.iter_content(64 * 1024):
+            data += chunk
+            if len(data) > max_bytes:
+                raise ValueError("Image too large")
+    return bytes(data)
+
 def image_data(url):
+    cached = image_cache.get(url)
+    if cached is not None:
+        return cached or None
     try:
-        pil_image = Image.open(requests.get(url, stream=True).raw)
+        pil_image = Image.open(BytesIO(download_image(url)))
+        pil_image.draft("RGB", (IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+        pil_image.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
         buffered = BytesIO()
-        pil_image.save(buffered, format="JPEG")
+        pil_image.convert("RGB").save(buffered, format="JPEG", quality=85)
         base64_image = base64.b64encode(buffered.getvalue()).decode("utf-8")
-        return f"data:image/jpeg;base64,{base64_image}"
-    except Exception as e:
+        result = f"data:image/jpeg;base64,{base64_image}"
+    except Exception:
+        # Failures are remembered only briefly, so a transient timeout does not block
+        # the image for the full cache lifetime (0 disables failure caching).
+        if IMAGE_FAILURE_TTL:
+            image_cache.set(url, "", ttl=IMAGE_FAILURE_TTL)
         return None
+    image_cache.set(url, result)
+    return result
+
+def fetch_images(urls, limit=2, deadline=IMAGE_DEADLINE):
+    # Candidates are fetched in parallel and the first usable ones win, so a single
+    # slow image host cannot hold up the answer.
+    if not urls:
+        return []
+    futures = {image_executor().submit(image_data, url): url for url in urls}
+    images = []
+    with span("image_fetch", candidates=len(urls)) as fields:
+        try:
+            for future in as_completed(futures, timeout=deadline):
+                base64_image = future.result()
+                if base64_image:
+                    images.append((futures[future], base64_image))
+                if len(images) == limit:
+                    break
+        except TimeoutError:
+            pass
+        finally:
+            for future in futures:
+                future.cancel()
+        fields["images"] = len(images)
+    return images
 
 def initialise_session_state():
     if "chat_aborted" not in st.session_state:
@@ -34,9 +103,15 @@ def initialise_session_state():
     if "messages" not in st.session_state:
         clear_chat_history()
 
+    if "history_summary" not in st.session_state:
+        st.session_state.history_summary = {"upto": 1, "text": ""}
+
     if "vectorstore" not in st.session_state:
         st.session_state.vectorstore = False
 
+    if "collection_names" not in st.session_state:
+        st.session_state.collection_names = []
+
     if "temperature" not in st.session_state:
         st.session_state.temperature = 0.1
 
@@ -49,6 +124,9 @@ def initialise_session_state():
     if "top_k" not in st.session_state:
         st.session_state.top_k = 4
 
+    if "stream_metrics" not in st.session_state:
+        st.session_state.stream_metrics = None
+
     if "search_results" not in st.session_state:
         st.session_state.search_results = None
 